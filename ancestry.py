@@ -0,0 +1,168 @@
+import numpy as np
+
+import csr
+from colour import Colour, col_index, col_next, col_prev
+
+# Ancestry queries on the three trees of a Schnyder wood without walking paths.
+#
+# Each tree gets Euler tour entry and exit times and a binary lifting table: u is an ancestor
+# of v (u lies on the path from v to the root) when entry[u] <= entry[v] <= exit[u], and the
+# k-th ancestor is found in log k table lookups.
+#
+# Children are visited in order of their next-colour coordinate, which is their planar order
+# around the parent, so the tour also tells on which side of a tree path a node lies. Region
+# R_c(v) is bounded by the paths P_prev(v) and P_next(v), and u is in it exactly when u is on
+# one of them, or lies left of P_prev(v) (visited before v in the prev tree) and right of
+# P_next(v) (visited after v's subtree in the next tree).
+#
+# Nodes are indices 0..n-1, as in localroute.CompiledRouter, and every query takes arrays of
+# nodes (or single indices) and answers all of them at once.
+
+class TreeIndex:
+
+    def __init__(self, parent, root, key):
+        # parent[v] is -1 at the root and at nodes outside the tree; children are ordered by key
+        n = len(parent)
+        parent = np.asarray(parent, dtype=np.int64)
+        children = np.flatnonzero(parent >= 0)
+        children = children[np.lexsort((key[children], parent[children]))]
+        indptr, indices = csr.edges_to_csr(n, parent[children], children)
+
+        depth = np.full(n, -1, dtype=np.int64)
+        depth[root] = 0
+        levels = [np.array([root])]
+        while True:
+            _, level = csr.gather_rows(indptr, indices, levels[-1])
+            if len(level) == 0:
+                break
+            depth[level] = len(levels)
+            levels.append(level.astype(np.int64))
+
+        size = (depth >= 0).astype(np.int64)
+        for level in reversed(levels[1:]):
+            np.add.at(size, parent[level], size[level])
+        # Entry time of a child is one past its parent's plus the sizes of its earlier siblings
+        sizes = size[indices]
+        before = np.cumsum(sizes) - sizes
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        offset = np.zeros(n, dtype=np.int64)
+        offset[indices] = before - before[indptr[rows]]
+        entry = np.full(n, -1, dtype=np.int64)
+        entry[root] = 0
+        for level in levels[1:]:
+            entry[level] = entry[parent[level]] + 1 + offset[level]
+
+        # up[k, v] is the 2^k-th ancestor of v, -1 past the root
+        up = [np.where(depth > 0, parent, -1)]
+        while (1 << len(up)) <= depth.max():
+            above = up[-1]
+            up.append(np.where(above >= 0, above[np.maximum(above, 0)], -1))
+
+        self.root = root
+        self.depth = depth
+        self.entry = entry
+        self.exit = np.where(depth >= 0, entry + size - 1, -1)
+        self.up = np.array(up, dtype=np.int32 if n < 2 ** 31 else np.int64)
+
+    def is_ancestor(self, u, v):
+        # u lies on the path from v to the root (u == v included)
+        u, v = np.asarray(u), np.asarray(v)
+        return (self.depth[u] >= 0) & (self.depth[v] >= 0) & (self.entry[u] <= self.entry[v]) & (self.entry[v] <= self.exit[u])
+
+    def kth_ancestor(self, v, k):
+        # -1 where v is outside the tree or has fewer than k ancestors
+        v, k = np.broadcast_arrays(np.asarray(v, dtype=np.int64), np.asarray(k, dtype=np.int64))
+        result = np.where((k >= 0) & (k <= self.depth[v]), v, -1)
+        for (j, up) in enumerate(self.up):
+            step = ((k >> j) & 1 == 1) & (result >= 0)
+            result = np.where(step, up[np.maximum(result, 0)], result)
+        return result
+
+    def lca(self, u, v):
+        # Lowest common ancestor, where the paths of u and v to the root join; -1 outside the tree
+        u, v = np.broadcast_arrays(np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64))
+        valid = (self.depth[u] >= 0) & (self.depth[v] >= 0)
+        deeper = np.where(self.depth[u] >= self.depth[v], u, v)
+        other = np.where(self.depth[u] >= self.depth[v], v, u)
+        deeper = self.kth_ancestor(deeper, np.where(valid, self.depth[deeper] - self.depth[other], 0))
+        ancestor = self.is_ancestor(other, deeper)
+        for up in reversed(self.up):
+            a, b = up[deeper], up[other]
+            move = ~ancestor & (a != b)
+            deeper = np.where(move, a, deeper)
+            other = np.where(move, b, other)
+        result = np.where(ancestor, other, self.up[0][deeper])
+        return np.where(valid, result, -1)
+
+    def left_of(self, u, v):
+        # u is visited before v and is not on v's path to the root
+        u, v = np.asarray(u), np.asarray(v)
+        return (self.depth[u] >= 0) & (self.entry[u] < self.entry[v]) & ~self.is_ancestor(u, v)
+
+    def right_of(self, u, v):
+        # u is visited after the whole subtree of v
+        u, v = np.asarray(u), np.asarray(v)
+        return (self.depth[u] >= 0) & (self.depth[v] >= 0) & (self.entry[u] > self.exit[v])
+
+class AncestryIndex:
+
+    def __init__(self, parents, coords, roots):
+        # parents is the (3, n) parent array and coords the (n, 3) Schnyder coordinates, both in
+        # col_index order; roots is {colour: index}
+        self.roots = roots
+        self.trees = dict()
+        for colour in Colour:
+            key = np.asarray(coords)[:, col_index(col_next(colour))]
+            self.trees[colour] = TreeIndex(parents[col_index(colour)], roots[colour], key)
+
+    def depth(self, colour, v):
+        return self.trees[colour].depth[v]
+
+    def is_ancestor(self, colour, u, v):
+        # u lies on the colour path from v to its root
+        return self.trees[colour].is_ancestor(u, v)
+
+    def kth_ancestor(self, colour, v, k):
+        return self.trees[colour].kth_ancestor(v, k)
+
+    def in_region(self, colour, u, v):
+        # u lies in the closed region R_colour(v)
+        u, v = np.broadcast_arrays(np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64))
+        prev, next = self.trees[col_prev(colour)], self.trees[col_next(colour)]
+        inside = prev.is_ancestor(u, v) | next.is_ancestor(u, v) | (prev.left_of(u, v) & next.right_of(u, v))
+        # R_c of root c is everything, and R_c of another root is the root alone
+        inside = np.where(u == self.roots[colour], v == u, inside)
+        inside = np.where(v == self.roots[colour], True, inside)
+        others = (v == self.roots[col_prev(colour)]) | (v == self.roots[col_next(colour)])
+        return np.where(others, u == v, inside)
+
+    def path_intersection(self, colour_u, u, colour_v, v):
+        # The node where P_colour_u(u) meets P_colour_v(v), -1 if they do not meet. Paths of the
+        # same colour meet at their lowest common ancestor and share the rest of the way; paths
+        # of different colours share at most one node.
+        if colour_u == colour_v:
+            return self.trees[colour_u].lca(u, v)
+        u, v = np.broadcast_arrays(np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64))
+        # P(u) stays in R_colour_u(v) until it leaves through the boundary, which it cannot
+        # re-enter, so the only candidate is the last node of P(u) inside the region
+        tree = self.trees[colour_u]
+        inside = self.in_region(colour_u, u, v)
+        last = u.copy()
+        for up in reversed(tree.up):
+            above = up[last]
+            step = inside & (above >= 0)
+            step[step] = self.in_region(colour_u, above[step], v[step])
+            last = np.where(step, above, last)
+        meets = inside & (tree.depth[u] >= 0) & self.trees[colour_v].is_ancestor(last, v)
+        return np.where(meets, last, -1)
+
+def ancestry_index(router):
+    # AncestryIndex for a localroute.CompiledRouter; a root has no parents and its own tree
+    # is the one it has children in
+    parents = np.asarray(router.parents)
+    orphans = np.flatnonzero((parents < 0).all(axis=0))
+    roots = dict()
+    for colour in Colour:
+        has_children = np.bincount(parents[col_index(colour)][parents[col_index(colour)] >= 0], minlength=router.n) > 0
+        roots[colour] = int(orphans[has_children[orphans]][0])
+    return AncestryIndex(parents, router.coords, roots)
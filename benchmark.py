@@ -0,0 +1,163 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import networkx as nx
+import numpy as np
+
+import evaluation
+import localroute
+import schnyder
+import triangulation
+from colour import Colour
+
+# Benchmarks over generated triangulations, written to JSON.
+#
+#     python3 benchmark.py --sizes 100 1000 10000 100000 --output bench.json
+#     python3 benchmark.py --sizes 100 1000 --compare bench.json
+#
+# Every timing is in seconds. Timed blocks are repeated and report their minimum and median;
+# route latencies report percentiles over sampled (src, dest) pairs. Steps that grow faster
+# than linearly are capped by --max-tree-n and --max-eval-n and recorded as skipped above them.
+
+def build(edges):
+    # G and coloured edge lists from random_wood output, with the exterior edges Sage drops
+    coloured = {colour: list(map(tuple, edges[colour].tolist())) for colour in Colour}
+    G = nx.Graph()
+    for colour in Colour:
+        G.add_edges_from(coloured[colour])
+    G.add_edges_from([(-1, -2), (-2, -3), (-3, -1)])
+    return G, coloured
+
+def construct(G, coloured, compact=False):
+    # -1 = green root, -2 = blue root, -3 = red root
+    return schnyder.Schnyder(G, -3, coloured[Colour.RED], -1, coloured[Colour.GREEN], -2, coloured[Colour.BLUE], compact=compact)
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat}
+
+def latencies(fn, pairs):
+    times = []
+    for (s, t) in pairs:
+        start = time.perf_counter()
+        fn(s, t)
+        times.append(time.perf_counter() - start)
+    times = np.array(times)
+    return {'p50': float(np.percentile(times, 50)), 'p99': float(np.percentile(times, 99)),
+            'mean': float(times.mean()), 'samples': len(times)}
+
+def bench_size(n, seed, repeat, routes, destinations, max_tree_n, max_eval_n):
+    rng = np.random.default_rng(seed)
+    results = dict()
+    start = time.perf_counter()
+    edges = triangulation.random_wood(n, seed)
+    elapsed = time.perf_counter() - start
+    results['generate'] = {'min': elapsed, 'median': elapsed, 'repeat': 1}
+    G, coloured = build(edges)
+
+    results['construction'] = timed(lambda: construct(G, coloured), repeat)
+    results['construction_compact'] = timed(lambda: construct(G, coloured, compact=True), repeat)
+    S = construct(G, coloured)
+    results['compute_all'] = timed(lambda: schnyder.Data(S.woods).compute_all(), repeat)
+
+    # Distinct source and destination pairs
+    nodes = list(G.nodes)
+    src = rng.integers(0, len(nodes), size=routes)
+    dest = (src + rng.integers(1, len(nodes), size=routes)) % len(nodes)
+    pairs = [(nodes[a], nodes[b]) for (a, b) in zip(src.tolist(), dest.tolist())]
+    # The default path: a fresh Schnyder object, coordinates memoized as routes need them
+    fresh = construct(G, coloured)
+    results['route_latency_memoized'] = latencies(lambda s, t: localroute.schnyder_local_route(G, fresh, s, t), pairs)
+    S.data.compute_all()
+    results['route_latency'] = latencies(lambda s, t: localroute.schnyder_local_route(G, S, s, t), pairs)
+    R = localroute.compile_router(G, S)
+    results['compiled_route_latency'] = latencies(R.route, pairs)
+
+    targets = [nodes[i] for i in rng.integers(0, len(nodes), size=destinations).tolist()]
+    if n <= max_tree_n:
+        results['fixed_dest_routing_tree'] = timed(lambda: [localroute.fixed_dest_routing_tree(G, S, t) for t in targets], 1)
+        results['fixed_dest_routing_tree']['per_destination'] = results['fixed_dest_routing_tree']['min'] / destinations
+    else:
+        results['fixed_dest_routing_tree'] = {'skipped': True}
+    results['next_hops'] = timed(lambda: [R.next_hops(R.index[t]) for t in targets], repeat)
+    results['next_hops']['per_destination'] = results['next_hops']['min'] / destinations
+
+    if n <= max_eval_n:
+        results['evaluate_routing_protocol_faster'] = timed(lambda: evaluation.evaluate_routing_protocol_faster(G, S), 1)
+    else:
+        results['evaluate_routing_protocol_faster'] = {'skipped': True}
+    return results
+
+def run(sizes, seed=0, repeat=3, routes=200, destinations=5, max_tree_n=10000, max_eval_n=1000):
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'networkx': nx.__version__,
+            'machine': platform.machine(),
+            'seed': seed,
+            'repeat': repeat,
+            'routes': routes,
+            'destinations': destinations
+        },
+        'results': dict()
+    }
+    for n in sizes:
+        report['results'][str(n)] = bench_size(n, seed, repeat, routes, destinations, max_tree_n, max_eval_n)
+    return report
+
+# Comparison against a stored report. Only the typical figures are compared: the median of
+# timed blocks and the p50 and p99 of latencies.
+
+compared_fields = ['median', 'p50', 'p99']
+
+def compare(report, baseline, threshold=0.25):
+    # Returns [(n, benchmark, field, baseline, current, ratio, regressed)] for every figure in both
+    rows = []
+    for (n, results) in report['results'].items():
+        for (name, figures) in results.items():
+            old = baseline['results'].get(n, dict()).get(name, dict())
+            for field in compared_fields:
+                if field in figures and field in old and old[field] > 0:
+                    ratio = figures[field] / old[field]
+                    rows.append((n, name, field, old[field], figures[field], ratio, ratio > 1 + threshold))
+    return rows
+
+def print_comparison(rows):
+    for (n, name, field, old, new, ratio, regressed) in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f'{n:>7} {name:<34} {field:<7} {old:12.6f} {new:12.6f} {ratio:6.2f}x {flag}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Schnyder construction, coordinates, routing and evaluation')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--routes', type=int, default=200)
+    parser.add_argument('--destinations', type=int, default=5)
+    parser.add_argument('--max-tree-n', type=int, default=10000)
+    parser.add_argument('--max-eval-n', type=int, default=1000)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None, help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown ratio above 1 that counts as a regression')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.seed, args.repeat, args.routes, args.destinations, args.max_tree_n, args.max_eval_n)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            sys.exit(1)
@@ -24,4 +24,9 @@ def col_next(colour):
     return col_next_map[colour]
 
 def col_prev(colour):
-    return col_prev_map[colour]
\ No newline at end of file
+    return col_prev_map[colour]
+
+# Position of each colour in per-colour arrays
+
+def col_index(colour):
+    return colour.value - 1
@@ -0,0 +1,57 @@
+import numpy as np
+
+# Compressed sparse row helpers. Nodes are integers 0..n-1.
+
+def edges_to_csr(n, sources, targets):
+    # Groups targets by source, keeping the input order within each row
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    indices = targets[order].astype(np.int32)
+    return indptr, indices
+
+def row(indptr, indices, node):
+    return indices[indptr[node]:indptr[node + 1]]
+
+def gather_rows(indptr, indices, nodes):
+    # Concatenates the rows of nodes; also returns the position in nodes each entry came from
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    segment = np.repeat(np.arange(len(nodes)), counts)
+    offsets = np.cumsum(counts) - counts
+    positions = np.arange(len(segment)) + np.repeat(starts - offsets, counts)
+    return segment, indices[positions]
+
+def graph_to_csr(G, index):
+    # Undirected adjacency with each row in G.adj order, so neighbour scans match NetworkX
+    sources = [index[u] for (u, neighbours) in G.adj.items() for _ in neighbours]
+    targets = [index[v] for neighbours in G.adj.values() for v in neighbours]
+    return edges_to_csr(len(index), sources, targets)
+
+def bfs_distances(indptr, indices, sources, out=None, max_depth=None):
+    # Breadth first search from every node in sources at once, level by level.
+    # Row i of the result holds the hop distances from sources[i]; -1 where unreachable,
+    # or farther than max_depth when given.
+    n = len(indptr) - 1
+    sources = np.asarray(sources, dtype=np.int64)
+    if out is None:
+        out = np.empty((len(sources), n), dtype=np.int32)
+    out.fill(-1)
+    flat = out.reshape(-1)
+    keys = np.arange(len(sources), dtype=np.int64) * n + sources
+    flat[keys] = 0
+    level = 0
+    while len(keys) > 0 and (max_depth is None or level < max_depth):
+        level += 1
+        rows, nodes = np.divmod(keys, n)
+        segment, neighbours = gather_rows(indptr, indices, nodes)
+        keys = rows[segment] * n + neighbours
+        keys = keys[flat[keys] == -1]
+        # Deduplicate without sorting: each unvisited slot keeps the last position written to it
+        claim = -2 - np.arange(len(keys), dtype=np.int64)
+        flat[keys] = claim
+        keys = keys[flat[keys] == claim]
+        flat[keys] = level
+    return out
@@ -0,0 +1,129 @@
+import numpy as np
+
+# Streaming aggregation of routing distortion over (s, t) pairs.
+# Distortion is routing distance / true distance, both small integers, so counting pairs by
+# (routing, true) gives exact min, max, mean, quantiles and histograms in O(r * d) memory,
+# where r is the longest route and d the diameter, instead of a dict entry per pair.
+
+class DistortionStats:
+
+    def __init__(self, worst_k=10):
+        self.worst_k = worst_k
+        self.counts = np.zeros((1, 1), dtype=np.int64)
+        # Worst pairs seen so far as parallel arrays
+        self.worst_distortion = np.zeros(0, dtype=np.float64)
+        self.worst_src = np.zeros(0, dtype=np.int64)
+        self.worst_dest = np.zeros(0, dtype=np.int64)
+
+    def add(self, routing, true, src, dest):
+        # routing, true, src and dest are arrays over pairs, or dest is a single node
+        routing = np.asarray(routing, dtype=np.int64)
+        true = np.asarray(true, dtype=np.int64)
+        src = np.asarray(src, dtype=np.int64)
+        dest = np.broadcast_to(np.asarray(dest, dtype=np.int64), src.shape)
+        if len(routing) == 0:
+            return
+        self.grow(routing.max() + 1, true.max() + 1)
+        shape = self.counts.shape
+        self.counts += np.bincount(routing * shape[1] + true, minlength=shape[0] * shape[1]).reshape(shape)
+        self.keep_worst(routing / true, src, dest)
+
+    def grow(self, rows, columns):
+        rows = max(rows, self.counts.shape[0])
+        columns = max(columns, self.counts.shape[1])
+        if (rows, columns) != self.counts.shape:
+            counts = np.zeros((rows, columns), dtype=np.int64)
+            counts[:self.counts.shape[0], :self.counts.shape[1]] = self.counts
+            self.counts = counts
+
+    def keep_worst(self, distortion, src, dest):
+        distortion = np.concatenate([self.worst_distortion, distortion])
+        src = np.concatenate([self.worst_src, src])
+        dest = np.concatenate([self.worst_dest, dest])
+        if len(distortion) > self.worst_k:
+            if self.worst_k > 0:
+                keep = np.argpartition(-distortion, self.worst_k - 1)[:self.worst_k]
+            else:
+                keep = np.zeros(0, dtype=np.int64)
+            distortion, src, dest = distortion[keep], src[keep], dest[keep]
+        order = np.argsort(-distortion, kind='stable')
+        self.worst_distortion, self.worst_src, self.worst_dest = distortion[order], src[order], dest[order]
+
+    def merge(self, other):
+        self.grow(*other.counts.shape)
+        self.counts[:other.counts.shape[0], :other.counts.shape[1]] += other.counts
+        self.keep_worst(other.worst_distortion, other.worst_src, other.worst_dest)
+        return self
+
+    # Distinct distortion values in increasing order, with their pair counts
+
+    def values(self):
+        routing, true = np.nonzero(self.counts)
+        ratios = routing / true
+        order = np.argsort(ratios, kind='stable')
+        ratios, weights = ratios[order], self.counts[routing, true][order]
+        distinct, start = np.unique(ratios, return_index=True)
+        return distinct, np.add.reduceat(weights, start) if len(weights) > 0 else weights
+
+    def count(self):
+        return int(self.counts.sum())
+
+    def min(self):
+        return float(self.values()[0][0])
+
+    def max(self):
+        return float(self.values()[0][-1])
+
+    def mean(self):
+        routing, true = np.nonzero(self.counts)
+        weights = self.counts[routing, true]
+        return float((routing / true * weights).sum() / weights.sum())
+
+    def quantile(self, q):
+        # Smallest distortion d with at least a fraction q of pairs <= d
+        distinct, weights = self.values()
+        cumulative = np.cumsum(weights)
+        return float(distinct[np.searchsorted(cumulative, q * cumulative[-1])])
+
+    def histogram(self, bins=20, range=None):
+        distinct, weights = self.values()
+        return np.histogram(distinct, bins=bins, range=range, weights=weights)
+
+    def worst(self, nodes=None):
+        # [(distortion, src, dest)], mapped through nodes when given
+        pairs = zip(self.worst_distortion.tolist(), self.worst_src.tolist(), self.worst_dest.tolist())
+        if nodes is None:
+            return list(pairs)
+        return [(d, nodes[s], nodes[t]) for (d, s, t) in pairs]
+
+    def summary(self, nodes=None, quantiles=(0.5, 0.9, 0.99)):
+        if self.count() == 0:
+            return {'count': 0}
+        return {
+            'count': self.count(),
+            'min': self.min(),
+            'max': self.max(),
+            'mean': self.mean(),
+            'quantiles': {str(q): self.quantile(q) for q in quantiles},
+            'worst': self.worst(nodes)
+        }
+
+    # Plain dict form for JSON and for passing between processes
+
+    def to_dict(self):
+        routing, true = np.nonzero(self.counts)
+        return {
+            'worst_k': self.worst_k,
+            'counts': [routing.tolist(), true.tolist(), self.counts[routing, true].tolist()],
+            'worst': [self.worst_distortion.tolist(), self.worst_src.tolist(), self.worst_dest.tolist()]
+        }
+
+def from_dict(data):
+    stats = DistortionStats(data['worst_k'])
+    routing, true, counts = (np.array(column, dtype=np.int64) for column in data['counts'])
+    if len(counts) > 0:
+        stats.grow(routing.max() + 1, true.max() + 1)
+        stats.counts[routing, true] = counts
+    distortion, src, dest = data['worst']
+    stats.keep_worst(np.array(distortion, dtype=np.float64), np.array(src, dtype=np.int64), np.array(dest, dtype=np.int64))
+    return stats
@@ -0,0 +1,96 @@
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from colour import Colour, col_index
+
+# Schnyder's straight-line grid drawing. With the face-count coordinates from
+# Data.compute_all, vertex v is placed at (v_red, v_blue); the drawing of a triangulation on
+# n vertices is planar on the (2n - 5) x (2n - 5) grid, with the red root at (2n - 5, 0), the
+# blue root at (0, 2n - 5) and the green root at the origin.
+#
+# Export works on arrays only (for example a storage.StoredWoods or a CompiledRouter) and
+# writes in chunks of rows, so memory stays bounded by the chunk size and no Python code runs
+# per node.
+
+def grid_positions(coords):
+    # (n, 2) int64 grid positions from the (n, 3) coordinates
+    coords = np.asarray(coords)
+    return np.stack([coords[:, col_index(Colour.RED)], coords[:, col_index(Colour.BLUE)]], axis=1).astype(np.int64)
+
+def edge_colours(parents, src, dest):
+    # Colour index of every edge src - dest, oriented along its tree edge; -1 for uncoloured.
+    # Returns (src, dest, colour) with src and dest swapped where the tree edge points back.
+    colour = np.full(len(src), -1, dtype=np.int64)
+    backward = np.zeros(len(src), dtype=bool)
+    for c in range(3):
+        forward = parents[c, src] == dest
+        reverse = parents[c, dest] == src
+        colour[forward | reverse] = c
+        backward |= reverse
+    return np.where(backward, dest, src), np.where(backward, src, dest), colour
+
+def drawing_chunks(labels, coords, indptr, indices, parents, chunk=1 << 16):
+    # Yields ('vertices', (k, 3) array of label, x, y) and then ('edges', (k, 3) array of
+    # source label, target label, colour index) chunks; each undirected edge appears once
+    n = len(labels)
+    labels = np.asarray(labels, dtype=np.int64)
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        yield 'vertices', np.column_stack([labels[start:end], grid_positions(coords[start:end])])
+    start = 0
+    while start < n:
+        # Rows start..end holding about chunk half-edges, and at least one row
+        end = int(np.searchsorted(indptr, indptr[start] + chunk, side='right')) - 1
+        end = min(max(end, start + 1), n)
+        rows = np.repeat(np.arange(start, end, dtype=np.int64), np.diff(indptr[start:end + 1]))
+        neighbours = np.asarray(indices[indptr[start]:indptr[end]], dtype=np.int64)
+        upper = rows < neighbours
+        src, dest, colour = edge_colours(parents, rows[upper], neighbours[upper])
+        yield 'edges', np.column_stack([labels[src], labels[dest], colour])
+        start = end
+
+def write_csv(prefix, labels, coords, indptr, indices, parents, chunk=1 << 16):
+    # Writes {prefix}.vertices.csv (node,x,y) and {prefix}.edges.csv (source,target,colour),
+    # colour being red, blue, green or empty for the outer triangle
+    names = np.array([colour.name.lower() for colour in sorted(Colour, key=col_index)] + [''])
+    with open(f'{prefix}.vertices.csv', 'w') as vertices, open(f'{prefix}.edges.csv', 'w') as edges:
+        vertices.write('node,x,y\n')
+        edges.write('source,target,colour\n')
+        for (kind, rows) in drawing_chunks(labels, coords, indptr, indices, parents, chunk):
+            if kind == 'vertices':
+                vertices.write(('%d,%d,%d\n' * len(rows)) % tuple(rows.ravel().tolist()))
+            else:
+                table = np.empty((len(rows), 3), dtype=object)
+                table[:, :2] = rows[:, :2]
+                table[:, 2] = names[rows[:, 2]]
+                edges.write(('%d,%d,%s\n' * len(rows)) % tuple(table.ravel().tolist()))
+
+vertex_dtype = np.dtype([('node', np.int64), ('x', np.int64), ('y', np.int64)])
+edge_dtype = np.dtype([('source', np.int64), ('target', np.int64), ('colour', np.int8)])
+
+def write_npy(prefix, labels, coords, indptr, indices, parents, chunk=1 << 16):
+    # Writes {prefix}.vertices.npy and {prefix}.edges.npy as structured arrays, filled through
+    # a memory map; colour is a col_index value, -1 for the outer triangle
+    n = len(labels)
+    vertices = open_memmap(f'{prefix}.vertices.npy', mode='w+', dtype=vertex_dtype, shape=(n,))
+    edges = open_memmap(f'{prefix}.edges.npy', mode='w+', dtype=edge_dtype, shape=(len(indices) // 2,))
+    written = {'vertices': 0, 'edges': 0}
+    for (kind, rows) in drawing_chunks(labels, coords, indptr, indices, parents, chunk):
+        target = vertices if kind == 'vertices' else edges
+        start = written[kind]
+        for (i, name) in enumerate(target.dtype.names):
+            target[name][start:start + len(rows)] = rows[:, i]
+        written[kind] += len(rows)
+    if written['edges'] != len(edges):
+        raise Exception('Adjacency is not symmetric')
+    vertices.flush()
+    edges.flush()
+
+def export_drawing(source, prefix, format='csv', chunk=1 << 16):
+    # source is a storage.StoredWoods or a localroute.CompiledRouter
+    labels = source.labels if hasattr(source, 'labels') else np.array(source.nodes, dtype=np.int64)
+    coords = source.coords
+    if coords is None:
+        coords = source.router().coords
+    write = {'csv': write_csv, 'npy': write_npy}[format]
+    write(prefix, labels, coords, source.indptr, source.indices, source.parents, chunk)
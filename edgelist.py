@@ -0,0 +1,98 @@
+import networkx as nx
+import numpy as np
+
+import schnyder
+import validation
+from colour import Colour
+
+# Reader for the Schnyder wood edgelists written by random_triangulation.sage and
+# triangulation.py, one coloured edge per line:
+#
+#     u v {'weight': 'colour'}
+#
+# The file is read in fixed size chunks and each chunk is tokenised and converted with NumPy,
+# so nothing is evaluated per line and memory beyond the result arrays stays bounded by the
+# chunk size.
+
+# -1 = green root, -2 = blue root, -3 = red root; Sage drops these edges from the export
+EXTERIOR_EDGES = [(-1, -2), (-2, -3), (-3, -1)]
+
+WEIGHT_TOKEN = b"{'weight':"
+COLOUR_TOKENS = {f"'{colour.name.lower()}'}}".encode(): colour for colour in Colour}
+
+def parse_chunk(chunk):
+    # Returns (sources, targets, colours) for the complete lines in chunk
+    tokens = chunk.split()
+    if len(tokens) % 4 != 0:
+        raise Exception('Malformed edgelist line')
+    if len(tokens) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.int8)
+    if not (np.array(tokens[2::4]) == WEIGHT_TOKEN).all():
+        raise Exception('Malformed edgelist line')
+    sources = np.array(tokens[0::4]).astype(np.int64)
+    targets = np.array(tokens[1::4]).astype(np.int64)
+    names = np.array(tokens[3::4])
+    colours = np.zeros(len(names), dtype=np.int8)
+    for (token, colour) in COLOUR_TOKENS.items():
+        colours[names == token] = colour.value
+    if (colours == 0).any():
+        raise Exception('Unexpected edge colour')
+    return sources, targets, colours
+
+def read_chunks(filename, chunk_size=1 << 24):
+    # Yields parsed arrays for consecutive runs of whole lines
+    with open(filename, 'rb') as f:
+        rest = b''
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = rest + block
+            end = block.rfind(b'\n') + 1
+            rest = block[end:]
+            yield parse_chunk(block[:end])
+        if rest.strip():
+            yield parse_chunk(rest)
+
+def read_wood_edgelist(filename, chunk_size=1 << 24):
+    # Returns (sources, targets, colours) as int64, int64 and int8 (Colour.value) arrays,
+    # in file order, with the exterior edges appended with colour 0
+    parts = list(read_chunks(filename, chunk_size))
+    exterior = np.array(EXTERIOR_EDGES, dtype=np.int64)
+    parts.append((exterior[:, 0], exterior[:, 1], np.zeros(len(exterior), dtype=np.int8)))
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+def first_appearance(sources, targets):
+    # Nodes in the order they first appear reading u, v line by line, as NetworkX adds them,
+    # and the position of each source in that order
+    both = np.stack([sources, targets], axis=1).reshape(-1)
+    nodes, first, inverse = np.unique(both, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(nodes), dtype=np.int64)
+    rank[order] = np.arange(len(nodes))
+    return nodes[order], rank[inverse.reshape(-1, 2)[:, 0]]
+
+def graph_edges(sources, targets, colours):
+    # Coloured edges grouped by source in first appearance order, the order NetworkX lists the
+    # edges of a DiGraph read from the same file, followed by the uncoloured exterior edges.
+    # Returns (nodes, sources, targets, colours).
+    nodes, source_rank = first_appearance(sources, targets)
+    coloured = np.flatnonzero(colours > 0)
+    order = np.concatenate([coloured[np.argsort(source_rank[coloured], kind='stable')], np.flatnonzero(colours == 0)])
+    return nodes, sources[order], targets[order], colours[order]
+
+def read_schnyder(filename, compact=False, validate=False):
+    # Graph and woods of an edgelist, with the adjacency order of reading it with NetworkX.
+    # With validate, raises if the file does not hold a valid Schnyder wood.
+    nodes, sources, targets, colours = graph_edges(*read_wood_edgelist(filename))
+    edges = list(zip(sources.tolist(), targets.tolist()))
+    G = nx.Graph()
+    G.add_nodes_from(nodes.tolist())
+    G.add_edges_from(edges)
+    coloured = {colour: [edges[i] for i in np.flatnonzero(colours == colour.value).tolist()] for colour in Colour}
+    # -1 = green root, -2 = blue root, -3 = red root
+    S = schnyder.Schnyder(G, -3, coloured[Colour.RED], -1, coloured[Colour.GREEN], -2, coloured[Colour.BLUE], compact=compact)
+    if validate:
+        validation.check_wood(G, S.woods)
+    return (G, S)
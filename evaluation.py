@@ -1,42 +1,140 @@
+import argparse
+import json
 import networkx as nx
+import numpy as np
+import csr
+import distortion
+import edgelist
+import instrument
 import schnyder
 import localroute
+import matrices
+import shared
+import storage
+import os
+import queue
 import sys
+from collections import deque
 from multiprocessing import Pool
 
 def evaluate_routing_protocol(G, S):
+    nodes = list(G.nodes)
+    index = {node: i for (i, node) in enumerate(nodes)}
+    indptr, indices = csr.graph_to_csr(G, index)
     true_distance = dict()
     routing_distance = dict()
     distortion = dict()
     for s in G.nodes:
+        true_dist_from_s = csr.bfs_distances(indptr, indices, [index[s]])[0].tolist()
         for t in G.nodes:
             if s != t:
-                true_distance[(s, t)] = nx.shortest_path_length(G, s, t)
+                true_distance[(s, t)] = true_dist_from_s[index[t]]
                 routing_distance[(s, t)] = len(localroute.schnyder_local_route(G, S, s, t))
                 distortion[(s, t)] = routing_distance[(s, t)] / true_distance[(s, t)]
             
     return distortion
 
-def evaluate_routing_protocol_faster(G, S):
-    routing_distance = dict()
+def destination_distances(R, targets, batch=64):
+    # Yields (t, routing distances to t, true distances to t) for each destination index
+    true_dist = np.empty((batch, R.n), dtype=np.int32)
+    for start in range(0, len(targets), batch):
+        chunk = targets[start:start + batch]
+        with instrument.phase('bfs'):
+            csr.bfs_distances(R.indptr, R.indices, chunk, out=true_dist[:len(chunk)])
+        for (row, t) in enumerate(chunk):
+            with instrument.phase('routing'):
+                routing_distance = localroute.routing_distances(R.next_hops(t), t)
+            yield (t, routing_distance, true_dist[row])
+
+def evaluate_routing_protocol_faster(G, S, batch=64):
+    # Full (s, t) -> distortion dict; only suitable for small graphs
+    R = localroute.compile_router(G, S)
     distortion = dict()
-    for t in G.nodes:
-        T = localroute.fixed_dest_routing_tree(G, S, t)
-        true_dist_to_t = dict(nx.single_target_shortest_path_length(G, t))
-        nodes = [t]
-        i = 0
-        while len(nodes) > 0:
-            i += 1
-            next_nodes = []
-            for node in nodes:
-                next_nodes.extend(list(T.predecessors(node)))
-            for s in next_nodes:
-                routing_distance[(s, t)] = i
-                distortion[(s, t)] = routing_distance[(s, t)] / true_dist_to_t[s]
-            nodes = next_nodes
+    for (ti, routing_distance, true_dist_to_t) in destination_distances(R, np.arange(R.n), batch):
+        t = R.nodes[ti]
+        routing_distance = routing_distance.tolist()
+        true_dist_to_t = true_dist_to_t.tolist()
+        for (i, s) in enumerate(R.nodes):
+            if s != t and routing_distance[i] > 0:
+                distortion[(s, t)] = routing_distance[i] / true_dist_to_t[i]
     return distortion
 
-def parse_edgelist_to_schnyder(filename):
+def write_distance_matrices(R, prefix, targets=None, batch=64):
+    # Fills the on-disk n x n matrices of matrices.py for targets, by default every destination
+    # whose row is not done yet, so calling it again after an interruption resumes the fill
+    output = matrices.create(prefix, R.nodes)
+    targets = output.pending() if targets is None else np.asarray(targets, dtype=np.int64)
+    targets = targets[~output.done[targets]]
+    routing = np.empty((batch, R.n), dtype=np.int64)
+    true = np.empty((batch, R.n), dtype=np.int64)
+    for start in range(0, len(targets), batch):
+        chunk = targets[start:start + batch]
+        for (row, (t, routing_distance, true_dist_to_t)) in enumerate(destination_distances(R, chunk, batch)):
+            routing[row] = routing_distance
+            true[row] = true_dist_to_t
+        output.write_rows(chunk, routing[:len(chunk)], true[:len(chunk)])
+    return output
+
+def evaluate_routing_protocol_matrices(G, S, prefix, batch=64):
+    # Every (s, t) routing and true distance, written to memory-mapped files under prefix
+    return write_distance_matrices(localroute.compile_router(G, S), prefix, batch=batch)
+
+def evaluate_destinations(R, targets, worst_k=10, batch=64):
+    stats = distortion.DistortionStats(worst_k)
+    for (t, routing_distance, true_dist_to_t) in destination_distances(R, targets, batch):
+        with instrument.phase('statistics'):
+            src = np.flatnonzero(routing_distance > 0)
+            stats.add(routing_distance[src], true_dist_to_t[src], src, t)
+    return stats
+
+def evaluate_routing_protocol_streaming(G, S, worst_k=10, batch=64):
+    # Same pairs as evaluate_routing_protocol_faster, aggregated in O(n) memory
+    with instrument.phase('compile'):
+        R = localroute.compile_router(G, S)
+    return evaluate_destinations(R, np.arange(R.n), worst_k, batch)
+
+# Parallel evaluation of one graph: destinations are split into shards across a process pool,
+# and the router arrays live in shared memory so workers map them instead of copying.
+
+worker_router = None
+worker_blocks = None
+
+def init_worker(specs):
+    global worker_router, worker_blocks
+    worker_blocks, arrays = shared.attach_arrays(specs)
+    worker_router = localroute.CompiledRouter(range(len(arrays['coords'])), arrays['indptr'], arrays['indices'],
+                                              arrays['parents'], arrays['coords'])
+    worker_router.edge_keys = arrays['edge_keys']
+
+def evaluate_shard(job):
+    start, stop, worst_k, batch = job
+    return evaluate_destinations(worker_router, np.arange(start, stop), worst_k, batch).to_dict()
+
+def evaluate_router_parallel(R, processes=None, shards=None, worst_k=10, batch=64):
+    processes = processes or os.cpu_count()
+    shards = shards or 4 * processes
+    bounds = np.linspace(0, R.n, min(shards, R.n) + 1).astype(np.int64).tolist()
+    jobs = [(start, stop, worst_k, batch) for (start, stop) in zip(bounds, bounds[1:]) if start < stop]
+    blocks, specs = shared.share_arrays({
+        'indptr': R.indptr,
+        'indices': R.indices,
+        'parents': R.parents,
+        'coords': R.coords,
+        'edge_keys': R.edge_key_table()
+    })
+    stats = distortion.DistortionStats(worst_k)
+    try:
+        with Pool(processes=processes, initializer=init_worker, initargs=(specs,)) as pool:
+            for partial in pool.imap_unordered(evaluate_shard, jobs):
+                stats.merge(distortion.from_dict(partial))
+    finally:
+        shared.release(blocks)
+    return stats
+
+def evaluate_routing_protocol_parallel(G, S, processes=None, shards=None, worst_k=10, batch=64):
+    return evaluate_router_parallel(localroute.compile_router(G, S), processes, shards, worst_k, batch)
+
+def parse_edgelist_to_schnyder_networkx(filename, compact=False):
     input = nx.read_edgelist(filename,nodetype=int,create_using=nx.DiGraph())
     # print(input.edges(data=True))
     
@@ -61,39 +159,169 @@ def parse_edgelist_to_schnyder(filename):
     # Add back in the exterior edges, which sage removes for some reason
     G.add_edges_from([(-1, -2), (-2, -3), (-3, -1)])
     # -1 = green root, -2 = blue root, -3 = red root
-    S = schnyder.Schnyder(G, -3, red_edges, -1, green_edges, -2, blue_edges)
+    S = schnyder.Schnyder(G, -3, red_edges, -1, green_edges, -2, blue_edges, compact=compact)
     return (G, S)
 
+def parse_edgelist_to_schnyder(filename, compact=False, validate=False):
+    # Same graph and woods as parse_edgelist_to_schnyder_networkx, with the same adjacency order.
+    # With validate, raises if the file does not hold a valid Schnyder wood.
+    return edgelist.read_schnyder(filename, compact, validate)
+
 def evaluate_test(test):
-    G, S = parse_edgelist_to_schnyder(test)
+    # With instrument enabled, the time spent in each phase is recorded under parse, compile,
+    # bfs, routing and statistics
+    with instrument.phase('parse'):
+        G, S = parse_edgelist_to_schnyder(test)
     # print(G.edges)
-    distortion = evaluate_routing_protocol_faster(G, S)
-    # print(f'Min distortion: {min(distortion.values())}')
-    # print(f'Max distortion: {max(distortion.values())}')
-    return (min(distortion.values()), max(distortion.values()))
+    stats = evaluate_routing_protocol_streaming(G, S)
+    # print(f'Min distortion: {stats.min()}')
+    # print(f'Max distortion: {stats.max()}')
+    return (stats.min(), stats.max())
+
+# Resumable evaluation of many edgelists. Each graph's destinations are split into shards of
+# at most shard_size, evaluated as separate jobs and consumed as they finish. Checkpoints are
+# JSON files under checkpoint_dir named by the SHA-256 of the edgelist: one per finished shard,
+# replaced by one per finished graph once all its shards are in, so a rerun skips completed
+# graphs and shards even if files were renamed. Edgelists go through the storage parse cache
+# in cache_dir, so every job maps the same binary file instead of parsing again; shard jobs
+# are given its path and never hash the edgelist themselves.
+
+def checkpoint_path(checkpoint_dir, digest, shard=None, shards=None):
+    if shard is None:
+        return os.path.join(checkpoint_dir, f'{digest}.json')
+    return os.path.join(checkpoint_dir, f'{digest}.{shard}-of-{shards}.json')
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_checkpoint(path, data):
+    partial = f'{path}.{os.getpid()}.tmp'
+    with open(partial, 'w') as f:
+        json.dump(data, f)
+    os.replace(partial, path)
+
+def shard_bounds(n, shards):
+    return np.linspace(0, n, shards + 1).astype(np.int64).tolist()
+
+def prepare_file(job):
+    # Converts the edgelist through the parse cache and returns its size
+    digest, filename, cache_dir = job
+    return 'prepared', digest, storage.load_edgelist_cached(filename, cache_dir, digest).n
+
+def evaluate_file_shard(job):
+    digest, cached, shard, shards, worst_k, batch = job
+    R = storage.load(cached).router()
+    bounds = shard_bounds(R.n, shards)
+    stats = evaluate_destinations(R, np.arange(bounds[shard], bounds[shard + 1]), worst_k, batch)
+    return 'shard', digest, shard, stats.to_dict()
+
+def finish_file(checkpoint_dir, digest, n, shards, worst_k):
+    # Merges the shard checkpoints of a graph into its graph checkpoint
+    stats = distortion.DistortionStats(worst_k)
+    paths = [checkpoint_path(checkpoint_dir, digest, shard, shards) for shard in range(shards)]
+    for path in paths:
+        stats.merge(distortion.from_dict(read_checkpoint(path)['stats']))
+    write_checkpoint(checkpoint_path(checkpoint_dir, digest), {'n': n, 'stats': stats.to_dict()})
+    for path in paths:
+        os.remove(path)
+    return stats
+
+def evaluate_files(files, jobs=1, shard_size=1000, checkpoint_dir='.evaluation_checkpoints', worst_k=10, batch=64, cache_dir='.schnyder_cache'):
+    # Yields (filename, n, DistortionStats) for every file, in order of completion; files with
+    # identical contents are evaluated once. Converting a file is a job of its own, and its
+    # shards are queued as soon as its size is known, so conversion runs in parallel too.
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    names = dict()
+    for filename in files:
+        names.setdefault(storage.file_hash(filename), []).append(filename)
+    todo = []
+    for (digest, filenames) in names.items():
+        done = read_checkpoint(checkpoint_path(checkpoint_dir, digest))
+        if done is None:
+            todo.append(digest)
+            continue
+        stats = distortion.from_dict(done['stats'])
+        for filename in filenames:
+            yield filename, done['n'], stats
+
+    sizes = dict()
+    missing = dict()
+    pool = Pool(processes=jobs) if jobs > 1 else None
+    # Without a pool, jobs run one at a time from the front of waiting, where a file's shards
+    # are put ahead of the remaining conversions
+    waiting = deque()
+    results = queue.Queue()
+    outstanding = 0
+
+    def submit(fn, job, first=False):
+        if pool is None:
+            if first:
+                waiting.appendleft((fn, job))
+            else:
+                waiting.append((fn, job))
+        else:
+            pool.apply_async(fn, (job,), callback=results.put, error_callback=results.put)
+
+    try:
+        for digest in todo:
+            submit(prepare_file, (digest, names[digest][0], cache_dir))
+            outstanding += 1
+        while outstanding > 0:
+            if pool is None:
+                fn, job = waiting.popleft()
+                result = fn(job)
+            else:
+                result = results.get()
+                if isinstance(result, BaseException):
+                    raise result
+            outstanding -= 1
+            if result[0] == 'prepared':
+                _, digest, n = result
+                shards = max(1, -(-n // shard_size))
+                sizes[digest] = (n, shards)
+                missing[digest] = {shard for shard in range(shards) if not os.path.exists(checkpoint_path(checkpoint_dir, digest, shard, shards))}
+                for shard in sorted(missing[digest], reverse=True):
+                    submit(evaluate_file_shard, (digest, storage.cache_path(cache_dir, digest), shard, shards, worst_k, batch), first=True)
+                    outstanding += 1
+            else:
+                _, digest, shard, partial = result
+                n, shards = sizes[digest]
+                write_checkpoint(checkpoint_path(checkpoint_dir, digest, shard, shards), {'n': n, 'stats': partial})
+                missing[digest].discard(shard)
+            if digest in missing and len(missing[digest]) == 0:
+                stats = finish_file(checkpoint_dir, digest, n, shards, worst_k)
+                del missing[digest]
+                for filename in names[digest]:
+                    yield filename, n, stats
+    finally:
+        if pool is not None:
+            pool.terminate()
 
 if __name__ == '__main__':
-    flush = True
-    n = 1000
-    tests = [f'eval-n{n}-{i}.edgelist' for i in range(1, 10+1)]
-
-    # Sequential
-    # for test in tests:
-    #     print(f'Test: {test}')
-        
-    #     mini, maxi = evaluate_test(test)
-    #     print(f'Min distortion: {mini}')
-    #     print(f'Max distortion: {maxi}')
-    #     if flush:
-    #         sys.stdout.flush()
-    
-    # Parallel
-    with Pool(processes=5) as pool:
-        results = pool.map(evaluate_test, tests)
-    
-    for i in range(0, len(tests)):
-        # print(f'Test: {tests[i]}')
-        mini, maxi = results[i]
-        # print(f'Min distortion: {mini}')
-        # print(f'Max distortion: {maxi}')
-        print(f'({n},{maxi})')
\ No newline at end of file
+    # python -m evaluation --n 1000 --jobs 5
+    # python -m evaluation --files graphs/*.edgelist --jobs 8 --shard-size 500
+    parser = argparse.ArgumentParser(description='Evaluate the distortion of Schnyder local routing, resuming from checkpoints')
+    parser.add_argument('--n', type=int, default=1000, help='graph size in the default file names eval-n{n}-{i}.edgelist')
+    parser.add_argument('--count', type=int, default=10, help='number of default files')
+    parser.add_argument('--files', nargs='+', default=None, help='edgelists to evaluate instead of the default files')
+    parser.add_argument('--jobs', type=int, default=5)
+    parser.add_argument('--shard-size', type=int, default=1000, help='destinations per checkpointed job')
+    parser.add_argument('--checkpoints', default='.evaluation_checkpoints')
+    parser.add_argument('--worst-k', type=int, default=10)
+    parser.add_argument('--cache', default='.schnyder_cache', help='directory for the parse cache of converted edgelists')
+    args = parser.parse_args()
+
+    files = args.files or [f'eval-n{args.n}-{i}.edgelist' for i in range(1, args.count + 1)]
+    # stdout keeps the ({n},{max distortion}) lines in file order; progress with file names,
+    # in order of completion, goes to stderr
+    finished = dict()
+    printed = 0
+    for (filename, n, stats) in evaluate_files(files, args.jobs, args.shard_size, args.checkpoints, args.worst_k, cache_dir=args.cache):
+        print(f'({n},{stats.max()}) {filename}', file=sys.stderr, flush=True)
+        finished[filename] = (n, stats.max())
+        while printed < len(files) and files[printed] in finished:
+            print('({},{})'.format(*finished[files[printed]]), flush=True)
+            printed += 1
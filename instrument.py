@@ -0,0 +1,74 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# Opt-in counters, small-integer distributions and phase timers for the hot paths.
+# Call sites check `instrument.enabled` before doing any work, so when it is off the cost is
+# one attribute lookup. State is per process.
+#
+#     instrument.enable()
+#     evaluation.evaluate_test('unittest4.edgelist')
+#     print(instrument.to_json())
+
+enabled = False
+counters = dict()
+distributions = dict()
+phases = dict()
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    counters.clear()
+    distributions.clear()
+    phases.clear()
+
+def count(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+def observe(name, value):
+    # Adds one observation of a small integer, such as a hop count or a scan length
+    histogram = distributions.setdefault(name, dict())
+    histogram[value] = histogram.get(value, 0) + 1
+
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        total = phases.setdefault(name, [0.0, 0])
+        total[0] += time.perf_counter() - start
+        total[1] += 1
+
+null_phase = nullcontext()
+
+def phase(name):
+    # with instrument.phase('bfs'): ... adds the block's wall time to the phase
+    if not enabled:
+        return null_phase
+    return timed_phase(name)
+
+def summary():
+    result = {
+        'counters': dict(sorted(counters.items())),
+        'distributions': dict(),
+        'phases': {name: {'seconds': seconds, 'calls': calls} for (name, (seconds, calls)) in sorted(phases.items())}
+    }
+    for (name, histogram) in sorted(distributions.items()):
+        observations = sum(histogram.values())
+        result['distributions'][name] = {
+            'count': observations,
+            'mean': sum(value * k for (value, k) in histogram.items()) / observations,
+            'max': max(histogram),
+            'histogram': {str(value): histogram[value] for value in sorted(histogram)}
+        }
+    return result
+
+def to_json(indent=2):
+    return json.dumps(summary(), indent=indent)
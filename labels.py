@@ -0,0 +1,125 @@
+import numpy as np
+
+import localroute
+from colour import Colour
+
+# Self-contained routing state per node. A node's label packs its three Schnyder coordinates
+# into one 64-bit word, `bits` bits each, in col_index order; coordinates are distinct, so the
+# label doubles as the node's address. Each node stores its label, the labels of its three
+# tree parents and the labels of its neighbours in adjacency order, which is all next_label
+# needs to forward a packet given only the destination's label.
+
+NO_PARENT = np.iinfo(np.uint64).max
+
+table_dtype = np.dtype([
+    ('label', np.uint64),
+    ('parents', np.uint64, (3,)),
+    ('offset', np.uint64),
+    ('degree', np.uint32)
+])
+
+def coordinate_bits(n):
+    # Bits for coordinates 0..2n - 5
+    return max(int(2 * n - 5).bit_length(), 1)
+
+def pack(coords, bits):
+    coords = np.asarray(coords, dtype=np.uint64)
+    return coords[..., 0] | coords[..., 1] << np.uint64(bits) | coords[..., 2] << np.uint64(2 * bits)
+
+def unpack(label, bits):
+    mask = (1 << bits) - 1
+    return (label & mask, label >> bits & mask, label >> 2 * bits & mask)
+
+class RoutingLabels:
+    # table is a packed structured array with one table_dtype record per node; the neighbour
+    # labels of node i are neighbours[offset:offset + degree]
+
+    def __init__(self, bits, table, neighbours, nodes=None):
+        self.bits = bits
+        self.table = table
+        self.neighbours = neighbours
+        self.nodes = nodes
+        # label -> row and node -> row, built on first use; only the network simulation and
+        # callers working with node names need them
+        self.rows = None
+        self.node_rows = None
+
+    def footprint(self):
+        # Bytes of routing state for the whole network
+        return self.table.nbytes + self.neighbours.nbytes
+
+    def state(self, i):
+        # (label, parent labels, neighbour labels) of node i as plain ints
+        record = self.table[i]
+        offset = int(record['offset'])
+        neighbours = self.neighbours[offset:offset + int(record['degree'])].tolist()
+        return int(record['label']), record['parents'].tolist(), neighbours
+
+    def row_of(self, label):
+        if self.rows is None:
+            self.rows = {label: i for (i, label) in enumerate(self.table['label'].tolist())}
+        return self.rows[label]
+
+    def label_of(self, node):
+        if self.node_rows is None:
+            self.node_rows = {node: i for (i, node) in enumerate(self.nodes)}
+        return int(self.table['label'][self.node_rows[node]])
+
+    def route(self, src, dest, max_hops=None):
+        # Labels visited on the way from the node labeled src to the node labeled dest. Like
+        # localroute.schnyder_local_route, raises once the route is longer than max_hops, by
+        # default n - 1, past which it can only be looping.
+        if max_hops is None:
+            max_hops = len(self.table) - 1
+        path = [src]
+        current = src
+        while current != dest:
+            if len(path) > max_hops:
+                raise Exception(f'Routing from label {src} to label {dest} exceeded {max_hops} hops')
+            current = next_label(self.state(self.row_of(current)), dest, self.bits)
+            path.append(current)
+        return path
+
+def encode(router):
+    # Labels for every node of a localroute.CompiledRouter
+    n = router.n
+    bits = coordinate_bits(n)
+    if 3 * bits > 64:
+        raise Exception(f'Coordinates of {n} nodes do not fit in a 64-bit label')
+    if (router.coords < 0).any():
+        raise Exception('Schnyder coordinates could not be computed for every node')
+    labels = pack(router.coords, bits)
+    if len(np.unique(labels)) != n:
+        raise Exception('Schnyder coordinates are not distinct')
+    table = np.zeros(n, dtype=table_dtype)
+    table['label'] = labels
+    parents = np.asarray(router.parents, dtype=np.int64).T
+    table['parents'] = np.where(parents >= 0, labels[np.maximum(parents, 0)], NO_PARENT)
+    table['offset'] = router.indptr[:-1]
+    table['degree'] = np.diff(router.indptr)
+    neighbours = labels[router.indices]
+    return RoutingLabels(bits, table, neighbours, router.nodes)
+
+def next_label(state, dest, bits):
+    # Next hop towards dest from the node whose state is (label, parent labels, neighbour
+    # labels); the same rule as CompiledRouter.next, on labels alone
+    label, parents, neighbours = state
+    if dest in neighbours:
+        return dest
+    src_coords = unpack(label, bits)
+    dest_coords = unpack(dest, bits)
+    code = localroute.pack_signature(src_coords, dest_coords)
+    if code not in localroute.signature_action:
+        raise Exception(f'Pessimistic signature invalid. P-sig: {code:03b}')
+    kind, c = localroute.signature_action[code]
+    if kind == localroute.PURE:
+        if parents[c] == NO_PARENT:
+            raise Exception(f'Cannot take {list(Colour)[c].name} parent of root {label}')
+        return parents[c]
+    a, b = (c + 1) % 3, (c + 2) % 3
+    for neighbour in neighbours:
+        neighbour_coords = unpack(neighbour, bits)
+        if (dest_coords[c] < neighbour_coords[c] and dest_coords[a] > neighbour_coords[a]
+                and dest_coords[b] > neighbour_coords[b] and neighbour_coords[c] < src_coords[c]):
+            return neighbour
+    raise Exception(f'No suitable neighbour found.')
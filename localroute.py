@@ -1,6 +1,12 @@
 import networkx as nx
+import numpy as np
 import time
-from colour import Colour
+from collections import OrderedDict
+
+import csr
+import instrument
+import schnyder
+from colour import Colour, col_index
 
 def sign(a):
     if a > 0:
@@ -51,10 +57,12 @@ anti_sig = {
 }
 
 def find_suitable_neighbour(G, S, src, dest, src_neighbours, colour):
-    for neighbour in src_neighbours:
+    for (scanned, neighbour) in enumerate(src_neighbours, 1):
         sig_neighbour_dest = schnyder_direction_sig(S, neighbour, dest)
         sig_src_neighbour = schnyder_direction_sig(S, src, neighbour)
         if sig_neighbour_dest == anti_sig[colour] and sig_src_neighbour[colour] == -1:
+            if instrument.enabled:
+                instrument.observe('next.anti.scan', scanned)
             return neighbour
     raise Exception(f'No suitable neighbour found.')
 
@@ -62,26 +70,40 @@ def schnyder_next(G, S, src, dest):
     src_neighbours = G.adj[src]
     # print(src_neighbours)
     if dest in src_neighbours:
+        if instrument.enabled:
+            instrument.count('next.adjacent')
         return dest
     else:
         sig = schnyder_direction_sig_pessimistic(S, src, dest)
         # print(f'p-sig: {sig}')
         for colour in Colour:
             if sig == pure_sig[colour]:
+                if instrument.enabled:
+                    instrument.count('next.pure')
                 return S.woods.parent(colour, src)
             elif sig == anti_sig[colour]:
+                if instrument.enabled:
+                    instrument.count('next.anti')
                 return find_suitable_neighbour(G, S, src, dest, src_neighbours, colour)
         raise Exception(f'Pessimistic signature invalid. P-sig: {sig}')
         
-def schnyder_local_route(G, S, src, dest):
+def schnyder_local_route(G, S, src, dest, max_hops=None):
+    # The next hop depends only on the current node and dest, so a route longer than n - 1 hops
+    # has revisited a node and would loop forever; the default budget stops it there
+    if max_hops is None:
+        max_hops = len(G) - 1
     current = src
     path = []
     while(current != dest):
+        if len(path) >= max_hops:
+            raise Exception(f'Routing from {src} to {dest} exceeded {max_hops} hops')
         # time.sleep(1)
         # print(current)
         next = schnyder_next(G, S, current, dest)
         path.append((current,next))
         current = next
+    if instrument.enabled:
+        instrument.observe('route.hops', len(path))
     return path
 
 def fixed_dest_routing_tree(G, S, dest):
@@ -91,4 +113,319 @@ def fixed_dest_routing_tree(G, S, dest):
         if node != dest:
             next = schnyder_next(G, S, node, dest)
             T.add_edge(node, next)
-    return T
\ No newline at end of file
+    return T
+
+# Compiled router: the same next-hop rule on integer arrays.
+# Nodes are indexed 0..n-1 in G.nodes order. The pessimistic signature of dest relative to src
+# is packed into 3 bits, bit col_index(colour) set when dest has the larger coordinate, and
+# looked up in a table instead of being compared as dicts.
+
+PURE = 0
+ANTI = 1
+
+signature_action = dict()
+for colour in Colour:
+    signature_action[1 << col_index(colour)] = (PURE, col_index(colour))
+    signature_action[7 ^ (1 << col_index(colour))] = (ANTI, col_index(colour))
+
+# The same table as arrays, for routing many packets at once; -1 marks an invalid signature
+signature_kind = np.full(8, -1, dtype=np.int64)
+signature_colour = np.zeros(8, dtype=np.int64)
+for (code, (kind, c)) in signature_action.items():
+    signature_kind[code] = kind
+    signature_colour[code] = c
+signature_bits = np.array([1, 2, 4], dtype=np.int64)
+
+def pack_signature(src_coords, dest_coords):
+    return (dest_coords[0] > src_coords[0]) | (dest_coords[1] > src_coords[1]) << 1 | (dest_coords[2] > src_coords[2]) << 2
+
+class CompiledRouter:
+    
+    def __init__(self, nodes, indptr, indices, parents, coords):
+        # parents is (3, n) with -1 at the roots, coords is the (n, 3) array from Data.compute_all
+        self.nodes = nodes
+        self.index = {node: i for (i, node) in enumerate(nodes)}
+        self.n = len(nodes)
+        self.indptr = indptr
+        self.indices = indices
+        self.parents = parents
+        self.coords = coords
+        # Python-level copies for single-hop routing and sorted edge keys, built on first use
+        self.scalar = None
+        self.edge_keys = None
+    
+    def scalar_tables(self):
+        if self.scalar is None:
+            coords = [tuple(row) for row in self.coords.tolist()]
+            parents = self.parents.tolist()
+            indices = self.indices.tolist()
+            indptr = self.indptr.tolist()
+            neighbours = [indices[indptr[i]:indptr[i + 1]] for i in range(self.n)]
+            self.scalar = (coords, parents, neighbours)
+        return self.scalar
+    
+    def next(self, src, dest):
+        coords, parents, neighbours = self.scalar_tables()
+        src_neighbours = neighbours[src]
+        if dest in src_neighbours:
+            return dest
+        src_coords = coords[src]
+        dest_coords = coords[dest]
+        code = pack_signature(src_coords, dest_coords)
+        if code not in signature_action:
+            raise Exception(f'Pessimistic signature invalid. P-sig: {code:03b}')
+        kind, c = signature_action[code]
+        if kind == PURE:
+            parent = parents[c][src]
+            if parent == -1:
+                raise Exception(f'Cannot take {list(Colour)[c].name} parent of root {self.nodes[src]}')
+            return parent
+        a, b = (c + 1) % 3, (c + 2) % 3
+        for neighbour in src_neighbours:
+            neighbour_coords = coords[neighbour]
+            if (dest_coords[c] < neighbour_coords[c] and dest_coords[a] > neighbour_coords[a]
+                    and dest_coords[b] > neighbour_coords[b] and neighbour_coords[c] < src_coords[c]):
+                return neighbour
+        raise Exception(f'No suitable neighbour found.')
+    
+    def edge_key_table(self):
+        if self.edge_keys is None:
+            rows = np.repeat(np.arange(self.n, dtype=np.int64), np.diff(self.indptr))
+            self.edge_keys = np.sort(rows * self.n + self.indices)
+        return self.edge_keys
+    
+    def adjacent(self, src, dest):
+        # Vectorized adjacency test by binary search in the sorted edge keys src * n + dest
+        edge_keys = self.edge_key_table()
+        keys = src * self.n + dest
+        found = np.minimum(np.searchsorted(edge_keys, keys), len(edge_keys) - 1)
+        return edge_keys[found] == keys
+    
+    def next_batch(self, src, dest, strict=True):
+        # Next hop for every (src[i], dest[i]) pair in one pass; src must differ from dest.
+        # With strict=False, pairs with no valid next hop get -1 instead of raising.
+        src = np.asarray(src, dtype=np.int64)
+        dest = np.asarray(dest, dtype=np.int64)
+        result = np.full(len(src), -1, dtype=np.int64)
+        adjacent = self.adjacent(src, dest)
+        result[adjacent] = dest[adjacent]
+        
+        src_coords = self.coords[src]
+        dest_coords = self.coords[dest]
+        code = (dest_coords > src_coords) @ signature_bits
+        kind = signature_kind[code]
+        c = signature_colour[code]
+        
+        pure = ~adjacent & (kind == PURE)
+        result[pure] = self.parents[c[pure], src[pure]]
+        
+        # Anti case with colour c: a neighbour x with dest[c] < x[c] < src[c] and x[j] < dest[j] otherwise
+        anti = np.flatnonzero(~adjacent & (kind == ANTI))
+        rows, candidates = csr.gather_rows(self.indptr, self.indices, src[anti])
+        counts = np.bincount(rows, minlength=len(anti))
+        colours = c[anti]
+        flat = self.coords.ravel()
+        position = 3 * candidates
+        suitable = flat[position + np.repeat(colours, counts)] < np.repeat(src_coords[anti, colours], counts)
+        for shift in (0, 1, 2):
+            column = (colours + shift) % 3
+            values = flat[position + np.repeat(column, counts)]
+            if shift == 0:
+                suitable &= values > np.repeat(dest_coords[anti, column], counts)
+            else:
+                suitable &= values < np.repeat(dest_coords[anti, column], counts)
+        # First suitable neighbour of each row, in adjacency order
+        entries = np.flatnonzero(suitable)
+        rows = rows[entries]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        result[anti[rows[first]]] = candidates[entries[first]]
+        
+        if strict:
+            failed = np.flatnonzero(result == -1)
+            if len(failed) > 0:
+                i = failed[0]
+                if kind[i] == -1:
+                    raise Exception(f'Pessimistic signature invalid. P-sig: {code[i]:03b}')
+                elif kind[i] == PURE:
+                    raise Exception(f'Cannot take {list(Colour)[c[i]].name} parent of root {self.nodes[src[i]]}')
+                raise Exception(f'No suitable neighbour found.')
+        return result
+    
+    def route_batch(self, src, dest, return_paths=False, max_hops=None):
+        # Routes every (src[i], dest[i]) pair in lockstep, one hop per step for all live packets.
+        # Returns hop counts, -1 for packets still travelling after max_hops, by default n - 1,
+        # past which a packet can only be looping.
+        # With return_paths, also returns (offsets, nodes): packet i visits nodes[offsets[i]:offsets[i + 1]].
+        if max_hops is None:
+            max_hops = self.n - 1
+        src = np.asarray(src, dtype=np.int64)
+        dest = np.asarray(dest, dtype=np.int64)
+        hops = np.zeros(len(src), dtype=np.int64)
+        current = src.copy()
+        live = np.flatnonzero(current != dest)
+        steps = []
+        while len(live) > 0:
+            if len(steps) >= max_hops:
+                break
+            next = self.next_batch(current[live], dest[live])
+            current[live] = next
+            hops[live] += 1
+            if return_paths:
+                steps.append((live, next))
+            else:
+                steps.append(None)
+            live = live[next != dest[live]]
+        
+        if not return_paths:
+            hops[live] = -1
+            return hops
+        offsets = np.zeros(len(src) + 1, dtype=np.int64)
+        np.cumsum(hops + 1, out=offsets[1:])
+        nodes = np.empty(offsets[-1], dtype=np.int64)
+        nodes[offsets[:-1]] = src
+        for (step, (packets, next)) in enumerate(steps):
+            nodes[offsets[packets] + step + 1] = next
+        hops[live] = -1
+        return hops, offsets, nodes
+    
+    def next_hops(self, dest, strict=True):
+        # Next hop towards dest from every node, with next_hops[dest] == dest
+        src = np.flatnonzero(np.arange(self.n) != dest)
+        next = np.empty(self.n, dtype=np.int64)
+        next[src] = self.next_batch(src, np.full(len(src), dest), strict)
+        next[dest] = dest
+        return next
+    
+    def indices_of(self, nodes):
+        return np.array([self.index[node] for node in nodes], dtype=np.int64)
+    
+    def next_hop(self, src, dest):
+        return self.nodes[self.next(self.index[src], self.index[dest])]
+    
+    def route(self, src, dest, max_hops=None):
+        # Same output as schnyder_local_route
+        if max_hops is None:
+            max_hops = self.n - 1
+        current = self.index[src]
+        dest = self.index[dest]
+        path = []
+        while current != dest:
+            if len(path) >= max_hops:
+                raise Exception(f'Routing from {src} to {self.nodes[dest]} exceeded {max_hops} hops')
+            next = self.next(current, dest)
+            path.append((self.nodes[current], self.nodes[next]))
+            current = next
+        return path
+
+def compile_router(G, S):
+    woods = schnyder.compact_woods(S.woods)
+    if S.data.region_size_triangles_array is None:
+        S.data.compute_all()
+    coords = S.data.region_size_triangles_array
+    if (coords < 0).any():
+        raise Exception('Schnyder coordinates could not be computed for every node')
+    parents = woods.parents.copy()
+    for root in woods.roots:
+        parents[:, woods.index[root]] = -1
+    indptr, indices = csr.graph_to_csr(G, woods.index)
+    return CompiledRouter(woods.nodes, indptr, indices, parents, coords)
+
+# Routing tables for popular destinations. Each cached destination holds its whole next-hop
+# vector from CompiledRouter.next_hops, one vectorized pass, so later queries to it are table
+# walks. Vectors are evicted least recently used first to stay within max_bytes.
+
+class RouteCache:
+    
+    def __init__(self, router, max_bytes=64 << 20):
+        self.router = router
+        self.max_bytes = max_bytes
+        self.dtype = np.int32 if router.n < 2 ** 31 else np.int64
+        self.tables = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def next_hops(self, dest):
+        # Next-hop vector towards dest, by index
+        table = self.tables.get(dest)
+        if table is not None:
+            self.hits += 1
+            self.tables.move_to_end(dest)
+            return table
+        self.misses += 1
+        table = self.router.next_hops(dest).astype(self.dtype)
+        table.flags.writeable = False
+        if table.nbytes <= self.max_bytes:
+            while self.bytes + table.nbytes > self.max_bytes:
+                _, evicted = self.tables.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+            self.tables[dest] = table
+            self.bytes += table.nbytes
+        return table
+    
+    def next(self, src, dest):
+        return int(self.next_hops(dest)[src])
+    
+    def next_hop(self, src, dest):
+        R = self.router
+        return R.nodes[self.next(R.index[src], R.index[dest])]
+    
+    def route(self, src, dest, max_hops=None):
+        # Same output as schnyder_local_route
+        R = self.router
+        if max_hops is None:
+            max_hops = R.n - 1
+        current = R.index[src]
+        dest = R.index[dest]
+        table = self.next_hops(dest)
+        path = []
+        while current != dest:
+            if len(path) >= max_hops:
+                raise Exception(f'Routing from {src} to {R.nodes[dest]} exceeded {max_hops} hops')
+            next = int(table[current])
+            path.append((R.nodes[current], R.nodes[next]))
+            current = next
+        return path
+    
+    def clear(self):
+        self.tables.clear()
+        self.bytes = 0
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+            'evictions': self.evictions,
+            'destinations': len(self.tables),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes
+        }
+
+def route_cache(G, S, max_bytes=64 << 20):
+    return RouteCache(compile_router(G, S), max_bytes)
+
+def routing_distances(next_hops, dest):
+    # Hops from every node to dest along a next-hop vector, by pointer jumping: after k rounds
+    # jump[v] is 2^k hops ahead of v, or dest if that is nearer, and distance[v] counts the hops
+    # to jump[v]. -1 for nodes that never reach dest.
+    n = len(next_hops)
+    jump = np.array(next_hops, dtype=np.int64)
+    jump[dest] = dest
+    distance = np.ones(n, dtype=np.int64)
+    distance[dest] = 0
+    live = np.flatnonzero(jump != dest)
+    live = live[jump[live] >= 0]
+    for _ in range(max(n - 1, 1).bit_length() + 1):
+        if len(live) == 0:
+            break
+        ahead = jump[live]
+        distance[live] += distance[ahead]
+        jump[live] = jump[ahead]
+        live = live[(jump[live] != dest) & (jump[live] >= 0)]
+    distance[jump != dest] = -1
+    return distance
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# Full routing and true distance matrices on disk, for analyses that need every (s, t) value.
+#
+# {prefix}.routing.npy and {prefix}.true.npy are n x n matrices with one row per destination:
+# row t holds the distance from every s to t. They use the smallest unsigned type that fits
+# (uint16 up to 65535 nodes, uint32 beyond), with the type's maximum marking pairs the router
+# never delivers. {prefix}.done.npy flags the rows that are complete and {prefix}.nodes.npy
+# holds the node labels in row order. Rows are flagged only after they are flushed, so an
+# interrupted fill resumes from the first unflagged row.
+#
+# All files are plain .npy, opened as memory maps: nothing is read until it is indexed, and
+# several processes may fill disjoint rows at once.
+
+def distance_dtype(n):
+    return np.dtype(np.uint16) if n <= np.iinfo(np.uint16).max else np.dtype(np.uint32)
+
+def filenames(prefix):
+    return {name: f'{prefix}.{name}.npy' for name in ['routing', 'true', 'done', 'nodes']}
+
+def create(prefix, nodes):
+    # Opens the matrices for writing, creating them if needed. Existing files are kept as long
+    # as they are for the same nodes, so completed rows survive.
+    files = filenames(prefix)
+    nodes = np.asarray(nodes, dtype=np.int64)
+    n = len(nodes)
+    if os.path.exists(files['nodes']):
+        if not np.array_equal(np.load(files['nodes']), nodes):
+            raise Exception(f'{prefix} holds matrices for different nodes')
+        return DistanceMatrices(prefix, mode='r+')
+    dtype = distance_dtype(n)
+    for name in ['routing', 'true']:
+        open_memmap(files[name], mode='w+', dtype=dtype, shape=(n, n)).flush()
+    open_memmap(files['done'], mode='w+', dtype=np.bool_, shape=(n,)).flush()
+    # Written last, so a prefix with a nodes file always has all the others
+    np.save(files['nodes'], nodes)
+    return DistanceMatrices(prefix, mode='r+')
+
+class DistanceMatrices:
+
+    def __init__(self, prefix, mode='r'):
+        files = filenames(prefix)
+        self.prefix = prefix
+        self.nodes = np.load(files['nodes'])
+        self.routing = np.load(files['routing'], mmap_mode=mode)
+        self.true = np.load(files['true'], mmap_mode=mode)
+        self.done = np.load(files['done'], mmap_mode=mode)
+        self.n = len(self.nodes)
+        self.unreachable = np.iinfo(self.routing.dtype).max
+
+    def pending(self):
+        # Destinations whose rows are not complete yet
+        return np.flatnonzero(~self.done)
+
+    def complete(self):
+        return bool(self.done.all())
+
+    def write_rows(self, targets, routing, true):
+        # routing and true are (len(targets), n) distances, -1 where unreachable
+        targets = np.asarray(targets, dtype=np.int64)
+        for (matrix, values) in [(self.routing, routing), (self.true, true)]:
+            values = np.asarray(values)
+            matrix[targets] = np.where(values < 0, self.unreachable, values)
+            matrix.flush()
+        self.done[targets] = True
+        self.done.flush()
+
+    def distortion(self, targets):
+        # Routing over true distance for the given rows; nan on the diagonal, for undelivered
+        # pairs and for rows not written yet
+        targets = np.asarray(targets, dtype=np.int64)
+        routing = self.routing[targets].astype(np.float64)
+        true = self.true[targets].astype(np.float64)
+        valid = (routing != self.unreachable) & (true > 0) & self.done[targets][..., None]
+        return np.where(valid, routing / np.where(true > 0, true, 1), np.nan)
@@ -1,5 +1,8 @@
 import networkx as nx
+import numpy as np
 
+import csr
+import instrument
 from colour import *
 
 class Woods:
@@ -24,7 +27,7 @@ class Woods:
         
         self.blue_root = blue_root
         self.blue_tree = nx.DiGraph()
-        self.green_tree.add_nodes_from(G.nodes)
+        self.blue_tree.add_nodes_from(G.nodes)
         self.blue_tree.add_edges_from(blue_edges)
         
         self.tree_map = {
@@ -43,6 +46,8 @@ class Woods:
         return self.root_map[colour]
     
     def parent(self, colour, node):
+        if instrument.enabled:
+            instrument.count('woods.parent')
         if node in self.roots:
             raise Exception(f'Cannot take {colour.name} parent of root {node}')
         parents = list(self.tree_map[colour].successors(node))
@@ -64,12 +69,182 @@ class Woods:
             path.append(current)
         return path
 
+    # Changing the wood in place. Use Data.flip_face and Data.insert_vertex, which keep the
+    # computed values in step; CompactWoods cannot be changed.
+
+    def edge_colour(self, u, w):
+        # Colour of the edge u -> w, or None if there is no such coloured edge
+        for colour in Colour:
+            if self.tree_map[colour].has_edge(u, w):
+                return colour
+        return None
+
+    def face_labels(self, face):
+        # Angle labels of an inner face as {colour: corner}. A corner is labeled with the colour
+        # of its incoming face edges, or the colour of neither edge if both face edges leave it.
+        # Every corner at a root is labeled with the root's colour.
+        if set(face) == self.roots:
+            raise Exception(f'{face} is the outer face')
+        labels = dict()
+        for (i, x) in enumerate(face):
+            if x in self.roots:
+                labels[[colour for colour in Colour if self.root(colour) == x][0]] = x
+                continue
+            others = [face[(i + 1) % 3], face[(i + 2) % 3]]
+            incoming = [self.edge_colour(y, x) for y in others]
+            outgoing = [self.edge_colour(x, y) for y in others]
+            if any(a is None and b is None for (a, b) in zip(incoming, outgoing)):
+                raise Exception(f'{face} is not an inner face of the wood')
+            incoming = [colour for colour in incoming if colour is not None]
+            if len(incoming) > 0:
+                labels[incoming[0]] = x
+            else:
+                labels[(set(Colour) - set(outgoing)).pop()] = x
+        if len(labels) != 3:
+            raise Exception(f'{face} is not an inner face of the wood')
+        return labels
+
+    def is_face(self, face):
+        # A triangle of the triangulation other than the outer face is a face exactly when it
+        # separates nothing. The corners' other neighbours then stay connected among themselves,
+        # along the corners' rotations, while a separating triangle splits them into the
+        # vertices inside and outside it.
+        corners = set(face)
+        around = set().union(*(self.G[x] for x in face)) - corners
+        start = next(iter(around))
+        seen = {start}
+        stack = [start]
+        while stack:
+            for y in self.G[stack.pop()]:
+                if y in around and y not in seen:
+                    seen.add(y)
+                    stack.append(y)
+        return len(seen) == len(around)
+
+    def set_parent(self, colour, node, parent):
+        tree = self.tree_map[colour]
+        tree.remove_edges_from(list(tree.out_edges(node)))
+        tree.add_edge(node, parent)
+
+    def add_vertex(self, node, parents):
+        # parents is {colour: parent}; the new vertex is adjacent to exactly its three parents
+        self.G.add_edges_from((node, parent) for parent in parents.values())
+        for colour in Colour:
+            self.tree_map[colour].add_node(node)
+            self.tree_map[colour].add_edge(node, parents[colour])
+        self.n = self.G.number_of_nodes()
+
+class CompactWoods:
+    # Array-backed Woods. Nodes are relabeled to 0..n-1 in G.nodes order; self.nodes maps back.
+    # Each colour has a parent array (-1 where there is no parent) and CSR child arrays.
+
+    def __init__(self, G, red_root, red_edges, green_root, green_edges, blue_root, blue_edges):
+        self.G = G
+        self.n = G.number_of_nodes()
+        
+        self.nodes = list(G.nodes)
+        self.index = {node: i for (i, node) in enumerate(self.nodes)}
+        
+        self.roots = {red_root, green_root, blue_root}
+        
+        self.root_map = {
+            Colour.RED: red_root,
+            Colour.BLUE: blue_root,
+            Colour.GREEN: green_root
+        }
+        
+        edge_map = {
+            Colour.RED: red_edges,
+            Colour.BLUE: blue_edges,
+            Colour.GREEN: green_edges
+        }
+        
+        self.parents = np.full((3, self.n), -1, dtype=np.int32)
+        self.child_offsets = dict()
+        self.child_indices = dict()
+        for colour in Colour:
+            sources = [self.index[edge[0]] for edge in edge_map[colour]]
+            targets = [self.index[edge[1]] for edge in edge_map[colour]]
+            parent = self.parents[col_index(colour)]
+            for (u, v) in zip(sources, targets):
+                if parent[u] != -1 and parent[u] != v:
+                    raise Exception(f'node {self.nodes[u]} has {colour.name} parents {[self.nodes[parent[u]], self.nodes[v]]}')
+                parent[u] = v
+            self.child_offsets[colour], self.child_indices[colour] = csr.edges_to_csr(self.n, targets, sources)
+    
+    @classmethod
+    def from_parents(cls, nodes, parents, red_root, green_root, blue_root, G=None):
+        # Builds the arrays directly from a (3, n) parent array indexed like nodes
+        woods = cls.__new__(cls)
+        woods.G = G
+        woods.n = len(nodes)
+        woods.nodes = list(nodes)
+        woods.index = {node: i for (i, node) in enumerate(woods.nodes)}
+        woods.roots = {red_root, green_root, blue_root}
+        woods.root_map = {
+            Colour.RED: red_root,
+            Colour.BLUE: blue_root,
+            Colour.GREEN: green_root
+        }
+        woods.parents = np.asarray(parents, dtype=np.int32)
+        woods.child_offsets = dict()
+        woods.child_indices = dict()
+        for colour in Colour:
+            parent = woods.parents[col_index(colour)]
+            children = np.flatnonzero(parent >= 0)
+            woods.child_offsets[colour], woods.child_indices[colour] = csr.edges_to_csr(woods.n, parent[children], children)
+        return woods
+    
+    def root(self, colour):
+        return self.root_map[colour]
+    
+    def parent(self, colour, node):
+        if instrument.enabled:
+            instrument.count('woods.parent')
+        if node in self.roots:
+            raise Exception(f'Cannot take {colour.name} parent of root {node}')
+        parent = self.parents[col_index(colour), self.index[node]]
+        assert parent != -1, f'node {node} has {colour.name} parents []'
+        return self.nodes[parent]
+    
+    def children(self, colour, node):
+        children = csr.row(self.child_offsets[colour], self.child_indices[colour], self.index[node])
+        return [self.nodes[child] for child in children]
+    
+    # Path nodes
+    
+    def path_nodes(self, colour, node):
+        if node == self.root(col_prev(colour)) or node == self.root(col_next(colour)):
+            raise Exception('Cannot find path for other coloured roots')
+        parent = self.parents[col_index(colour)]
+        roots = {self.index[root] for root in self.roots}
+        current = self.index[node]
+        path = [current]
+        while current not in roots:
+            current = parent[current]
+            assert current != -1, f'node {self.nodes[path[-1]]} has {colour.name} parents []'
+            path.append(current)
+        return [self.nodes[i] for i in path]
+
+def compact_woods(woods):
+    # Converts a Woods to a CompactWoods, leaving a CompactWoods unchanged
+    if isinstance(woods, CompactWoods):
+        return woods
+    edges = {colour: list(woods.tree_map[colour].edges) for colour in Colour}
+    return CompactWoods(woods.G,
+                        woods.root(Colour.RED), edges[Colour.RED],
+                        woods.root(Colour.GREEN), edges[Colour.GREEN],
+                        woods.root(Colour.BLUE), edges[Colour.BLUE])
+
 def memoizer(map, fn, input):
     if input not in map:
         map[input] = fn(input)
     return map[input]
 
 def memoizer2(map2, fn2, inputx, inputy):
+    if instrument.enabled:
+        # Counted per map, named after the compute function
+        instrument.count(f"memo.{fn2.__name__[len('compute_'):]}.{'hit' if inputy in map2[inputx] else 'miss'}")
     if inputy not in map2[inputx]:
         map2[inputx][inputy] = fn2(inputx, inputy)
     return map2[inputx][inputy]
@@ -112,9 +287,36 @@ class Data:
             Colour.BLUE: dict(),
             Colour.GREEN: dict()
         }
+        
+        # Filled by compute_all; entries of -1 fall back to the memoized maps
+        self.index = None
+        self.subtree_size_array = None
+        self.subtree_size_path_sum_array = None
+        self.path_length_array = None
+        self.region_size_nodes_array = None
+        self.region_size_triangles_array = None
+        # Python list copies of region_size_triangles_array per colour, which routing reads most;
+        # one list index is cheaper than indexing the array
+        self.region_size_triangles_lists = None
+        self.path_sum_column = {pair: i for (i, pair) in enumerate(self.subtree_size_path_sum_map)}
+    
+    def lookup(self, array, column, node):
+        # Only called once compute_all has filled the arrays, so the memoized path pays nothing
+        i = self.index.get(node)
+        if i is None or array[i, column] < 0:
+            if instrument.enabled:
+                instrument.count('array.miss')
+            return None
+        if instrument.enabled:
+            instrument.count('array.hit')
+        return int(array[i, column])
     
     # Subtree size in number of nodes
     def subtree_size(self, colour, node):
+        if self.index is not None:
+            value = self.lookup(self.subtree_size_array, col_index(colour), node)
+            if value is not None:
+                return value
         return memoizer2(self.subtree_size_map, self.compute_subtree_size, colour, node)
     
     def compute_subtree_size(self, colour, node):
@@ -134,6 +336,10 @@ class Data:
     # First colour is subtree, second colour is path
     
     def subtree_size_path_sum(self, col_tree, col_path, node):
+        if self.index is not None:
+            value = self.lookup(self.subtree_size_path_sum_array, self.path_sum_column[(col_tree, col_path)], node)
+            if value is not None:
+                return value
         return memoizer2(self.subtree_size_path_sum_map, self.compute_subtree_size_path_sum, (col_tree, col_path), node)
     
     def compute_subtree_size_path_sum(self, col_tuple, node):
@@ -146,6 +352,10 @@ class Data:
     # Region size in number of nodes
     
     def region_size_nodes(self, colour, node):
+        if self.index is not None:
+            value = self.lookup(self.region_size_nodes_array, col_index(colour), node)
+            if value is not None:
+                return value
         return memoizer2(self.region_size_nodes_map, self.compute_region_size_nodes, colour, node)
         
     def compute_region_size_nodes(self, colour, node):
@@ -161,6 +371,10 @@ class Data:
     # Path length in number of edges
     
     def path_length(self, colour, node):
+        if self.index is not None:
+            value = self.lookup(self.path_length_array, col_index(colour), node)
+            if value is not None:
+                return value
         return memoizer2(self.path_length_map, self.compute_path_length, colour, node)
     
     def compute_path_length(self, colour, node):
@@ -172,6 +386,16 @@ class Data:
     # Region size in number of triangles
     
     def region_size_triangles(self, colour, node):
+        if self.index is not None:
+            i = self.index.get(node)
+            if i is not None:
+                value = self.region_size_triangles_lists[colour][i]
+                if value >= 0:
+                    if instrument.enabled:
+                        instrument.count('array.hit')
+                    return value
+            if instrument.enabled:
+                instrument.count('array.miss')
         return memoizer2(self.region_size_triangles_map, self.compute_region_size_triangles, colour, node)
     
     def compute_region_size_triangles(self, colour, node):
@@ -184,9 +408,400 @@ class Data:
             exterior_cycle_length = self.path_length(col_prev(colour), node) + self.path_length(col_next(colour), node) + 1
             return 2 * n_nodes - 2 - exterior_cycle_length
 
+    # Bulk computation of every quantity above for all nodes and colours.
+    # Trees are processed level by level from their roots, so there is no recursion.
+    # Returns the (n, 3) array of Schnyder coordinates, columns ordered by col_index.
+    
+    def compute_all(self):
+        woods = compact_woods(self.woods)
+        n = woods.n
+        roots = {colour: woods.index[woods.root(colour)] for colour in Colour}
+        is_root = np.zeros(n, dtype=bool)
+        is_root[list(roots.values())] = True
+        
+        levels = dict()
+        subtree_size = np.full((n, 3), -1, dtype=np.int64)
+        path_length = np.full((n, 3), -1, dtype=np.int64)
+        for colour in Colour:
+            c = col_index(colour)
+            parent = woods.parents[c]
+            root = roots[colour]
+            
+            # Levels in breadth first order; other roots are kept as leaves
+            levels[colour] = [np.array([root])]
+            depth = np.full(n, -1, dtype=np.int64)
+            depth[root] = 0
+            frontier = levels[colour][0]
+            while len(frontier) > 0:
+                _, children = csr.gather_rows(woods.child_offsets[colour], woods.child_indices[colour], frontier)
+                children = children[depth[children] == -1]
+                if len(children) == 0:
+                    break
+                depth[children] = len(levels[colour])
+                levels[colour].append(children)
+                frontier = children[~is_root[children]]
+            
+            size = np.where(depth >= 0, 1, -1)
+            for level in reversed(levels[colour][1:]):
+                np.add.at(size, parent[level], size[level])
+            size[is_root] = 1
+            size[root] = n
+            subtree_size[:, c] = size
+            
+            depth[is_root] = -1
+            depth[root] = 0
+            path_length[:, c] = depth
+        
+        subtree_size_path_sum = np.full((n, len(self.path_sum_column)), -1, dtype=np.int64)
+        for ((col_tree, col_path), column) in self.path_sum_column.items():
+            size = subtree_size[:, col_index(col_tree)]
+            parent = woods.parents[col_index(col_path)]
+            path_sum = subtree_size_path_sum[:, column]
+            root = roots[col_path]
+            path_sum[root] = size[root]
+            for level in levels[col_path][1:]:
+                level = level[~is_root[level]]
+                above = path_sum[parent[level]]
+                path_sum[level] = np.where((above < 0) | (size[level] < 0), -1, above + size[level])
+        
+        region_size_nodes, region_size_triangles = self.region_sizes(subtree_size, subtree_size_path_sum, path_length, np.arange(n), roots, n)
+        
+        self.subtree_size_array = subtree_size
+        self.subtree_size_path_sum_array = subtree_size_path_sum
+        self.path_length_array = path_length
+        self.region_size_nodes_array = region_size_nodes
+        self.region_size_triangles_array = region_size_triangles
+        self.region_size_triangles_lists = {colour: region_size_triangles[:, col_index(colour)].tolist() for colour in Colour}
+        self.index = woods.index
+        return region_size_triangles
+
+    def region_sizes(self, subtree_size, subtree_size_path_sum, path_length, rows, roots, n):
+        # Region sizes in nodes and triangles for the given rows of the other arrays.
+        # roots is {colour: row}; -1 wherever an input is missing.
+        is_root = np.isin(rows, list(roots.values()))
+        region_size_nodes = np.full((len(rows), 3), -1, dtype=np.int64)
+        region_size_triangles = np.full((len(rows), 3), -1, dtype=np.int64)
+        for colour in Colour:
+            c = col_index(colour)
+            prev_sum = subtree_size_path_sum[rows, self.path_sum_column[(colour, col_prev(colour))]]
+            next_sum = subtree_size_path_sum[rows, self.path_sum_column[(colour, col_next(colour))]]
+            size = subtree_size[rows, c]
+            nodes = np.where((prev_sum < 0) | (next_sum < 0) | (size < 0), -1, prev_sum + next_sum - size)
+            prev_length = path_length[rows, col_index(col_prev(colour))]
+            next_length = path_length[rows, col_index(col_next(colour))]
+            triangles = np.where((nodes < 0) | (prev_length < 0) | (next_length < 0), -1,
+                                 2 * nodes - 2 - (prev_length + next_length + 1))
+            nodes[is_root] = 1
+            nodes[rows == roots[colour]] = n
+            triangles[is_root] = 0
+            triangles[rows == roots[colour]] = 2 * n - 5
+            region_size_nodes[:, c] = nodes
+            region_size_triangles[:, c] = triangles
+        return region_size_nodes, region_size_triangles
+
+    # Incremental updates for a Woods changed by face flips and vertex insertion.
+    # Subtree sizes change along the tree paths above the moved subtree, path lengths and path
+    # sums inside it, and path sums below those tree paths; only those cached entries are
+    # adjusted, in the memoized maps and the arrays alike. Region sizes are then recomputed for
+    # the nodes that were touched.
+
+    def adjust(self, map, array, column, key, nodes, delta):
+        # Adds delta to the cached entries of nodes, which must be distinct
+        memo = map[key]
+        if memo:
+            for node in nodes:
+                if node in memo:
+                    memo[node] += delta
+        if array is not None:
+            rows = np.array([self.index[node] for node in nodes], dtype=np.int64)
+            rows = rows[array[rows, column] >= 0]
+            array[rows, column] += delta
+
+    def adjust_subtree_size(self, colour, nodes, delta):
+        self.adjust(self.subtree_size_map, self.subtree_size_array, col_index(colour), colour, nodes, delta)
+
+    def adjust_path_length(self, colour, nodes, delta):
+        self.adjust(self.path_length_map, self.path_length_array, col_index(colour), colour, nodes, delta)
+
+    def adjust_path_sum(self, col_tree, col_path, nodes, delta):
+        pair = (col_tree, col_path)
+        self.adjust(self.subtree_size_path_sum_map, self.subtree_size_path_sum_array, self.path_sum_column[pair], pair, nodes, delta)
+
+    def subtree_nodes(self, colour, node):
+        # node and its descendants in the colour tree, without entering roots
+        nodes = [node]
+        for current in nodes:
+            nodes.extend(child for child in self.woods.children(colour, current) if child not in self.woods.roots)
+        return nodes
+
+    def inner_path(self, colour, node):
+        return [q for q in self.woods.path_nodes(colour, node) if q not in self.woods.roots]
+
+    def spread_size_change(self, colour, changes, touched):
+        # changes is {node: change in colour subtree size}. Path sums over colour subtree sizes
+        # change by the same amount for every node below in the other trees.
+        for (q, delta) in changes.items():
+            if delta == 0:
+                continue
+            self.adjust_subtree_size(colour, [q], delta)
+            touched.add(q)
+            for col_path in [col_prev(colour), col_next(colour)]:
+                below = self.subtree_nodes(col_path, q)
+                self.adjust_path_sum(colour, col_path, below, delta)
+                touched.update(below)
+
+    def refresh_regions(self, nodes):
+        nodes = list(nodes)
+        for map in [self.region_size_nodes_map, self.region_size_triangles_map]:
+            for memo in map.values():
+                if memo:
+                    for node in nodes:
+                        memo.pop(node, None)
+        if self.index is not None:
+            rows = np.array([self.index[node] for node in nodes], dtype=np.int64)
+            roots = {colour: self.index[self.woods.root(colour)] for colour in Colour}
+            self.region_size_nodes_array[rows], self.region_size_triangles_array[rows] = self.region_sizes(
+                self.subtree_size_array, self.subtree_size_path_sum_array, self.path_length_array, rows, roots, self.woods.n)
+            for colour in Colour:
+                values = self.region_size_triangles_lists[colour]
+                for (row, value) in zip(rows.tolist(), self.region_size_triangles_array[rows, col_index(colour)].tolist()):
+                    values[row] = value
+
+    def reparent(self, colour, node, parent, touched):
+        # Moves node, with its colour subtree, under parent
+        woods = self.woods
+        old = woods.parent(colour, node)
+        size = self.subtree_size(colour, node)
+        length_change = self.path_length(colour, parent) - self.path_length(colour, old)
+        sum_change = {col_tree: self.subtree_size_path_sum(col_tree, colour, parent) - self.subtree_size_path_sum(col_tree, colour, old)
+                      for col_tree in [col_prev(colour), col_next(colour)]}
+        changes = dict()
+        for q in self.inner_path(colour, old):
+            changes[q] = changes.get(q, 0) - size
+        for q in self.inner_path(colour, parent):
+            changes[q] = changes.get(q, 0) + size
+
+        woods.set_parent(colour, node, parent)
+        self.spread_size_change(colour, changes, touched)
+        moved = self.subtree_nodes(colour, node)
+        self.adjust_path_length(colour, moved, length_change)
+        for (col_tree, delta) in sum_change.items():
+            self.adjust_path_sum(col_tree, colour, moved, delta)
+        touched.update(moved)
+
+    def check_face(self, face):
+        woods = self.woods
+        if isinstance(woods, CompactWoods):
+            raise Exception('CompactWoods is read-only')
+        if set(face) == woods.roots:
+            raise Exception(f'{face} is the outer face')
+        if len(set(face)) != 3 or not all(woods.G.has_edge(face[i], face[i - 1]) for i in range(3)):
+            raise Exception(f'{face} is not a triangle of the graph')
+        if not woods.is_face(face):
+            raise Exception(f'{face} is a separating triangle, not a face')
+        return woods
+
+    def flip_face(self, face):
+        # Reverses a cyclically oriented inner face. Every corner keeps its outgoing colours:
+        # its outgoing face edge is replaced by the reversed incoming one, in the same colour.
+        woods = self.check_face(face)
+        x, y, z = face
+        for cycle in [(x, y, z), (x, z, y)]:
+            colours = [woods.edge_colour(cycle[i], cycle[(i + 1) % 3]) for i in range(3)]
+            if None not in colours:
+                break
+        else:
+            raise Exception(f'{face} is not a directed cycle')
+        touched = set()
+        for i in range(3):
+            self.reparent(colours[i], cycle[i], cycle[i - 1], touched)
+        self.refresh_regions(touched)
+
+    def insert_vertex(self, node, face):
+        # Adds node inside the inner face, with an outgoing edge of each colour to the corner
+        # with that angle label. The face is split in three, so one coordinate of every node
+        # grows by 2.
+        woods = self.check_face(face)
+        if woods.G.has_node(node):
+            raise Exception(f'{node} is already in the graph')
+        parents = woods.face_labels(face)
+        woods.add_vertex(node, parents)
+        if self.index is not None:
+            self.index[node] = len(self.index)
+            for name in ['subtree_size_array', 'subtree_size_path_sum_array', 'path_length_array',
+                         'region_size_nodes_array', 'region_size_triangles_array']:
+                array = getattr(self, name)
+                setattr(self, name, np.vstack([array, np.full((1, array.shape[1]), -1, dtype=array.dtype)]))
+            for values in self.region_size_triangles_lists.values():
+                values.append(-1)
+
+        touched = set(woods.roots) | {node}
+        for colour in Colour:
+            self.adjust_subtree_size(colour, [woods.root(colour)], 1)
+            self.spread_size_change(colour, {q: 1 for q in self.inner_path(colour, parents[colour])}, touched)
+        if self.index is not None:
+            i = self.index[node]
+            for colour in Colour:
+                self.subtree_size_array[i, col_index(colour)] = self.subtree_size(colour, node)
+                self.path_length_array[i, col_index(colour)] = self.path_length(colour, node)
+            for (pair, column) in self.path_sum_column.items():
+                self.subtree_size_path_sum_array[i, column] = self.subtree_size_path_sum(*pair, node)
+        self.refresh_regions(touched)
+
 class Schnyder:
     
-    def __init__(self, G, red_root, red_edges, green_root, green_edges, blue_root, blue_edges):
+    def __init__(self, G, red_root, red_edges, green_root, green_edges, blue_root, blue_edges, compact=False):
         self.G = G
-        self.woods = Woods(G, red_root, red_edges, green_root, green_edges, blue_root, blue_edges)
-        self.data = Data(self.woods)
\ No newline at end of file
+        if compact:
+            self.woods = CompactWoods(G, red_root, red_edges, green_root, green_edges, blue_root, blue_edges)
+        else:
+            self.woods = Woods(G, red_root, red_edges, green_root, green_edges, blue_root, blue_edges)
+        self.data = Data(self.woods)
+
+# Construction of the minimal (or maximal) Schnyder wood of a plane triangulation.
+# Inner vertices are contracted one at a time into the red root; the boundary of the
+# remaining graph around it is a path P from green root to blue root. A vertex of P can be
+# contracted when it has no chords to the rest of P. Contracting the contractible vertex
+# nearest the blue end every time gives the minimal wood, the one Sage's
+# minimal_schnyder_wood returns. Every vertex enters P once, so this is linear time.
+
+def from_triangulation(G, outer_face, minimal=True, rotation=None, compact=False):
+    # G is a NetworkX graph, a PlanarEmbedding, or an array of edges.
+    # outer_face is (red_root, green_root, blue_root).
+    # rotation optionally maps each node to its neighbours in clockwise (or counterclockwise) order.
+    if isinstance(G, nx.PlanarEmbedding):
+        if rotation is None:
+            rotation = {node: list(G.neighbors_cw_order(node)) for node in G.nodes}
+        G = nx.Graph(G.to_undirected(as_view=True).edges)
+    elif not isinstance(G, nx.Graph):
+        edges = np.asarray(G).tolist()
+        G = nx.Graph()
+        G.add_edges_from(edges)
+    
+    n = G.number_of_nodes()
+    if n < 3 or G.number_of_edges() != 3 * n - 6:
+        raise Exception(f'Graph is not a triangulation: {n} nodes, {G.number_of_edges()} edges')
+    if rotation is None:
+        planar, embedding = nx.check_planarity(G)
+        if not planar:
+            raise Exception('Graph is not planar')
+        rotation = {node: list(embedding.neighbors_cw_order(node)) for node in G.nodes}
+    
+    nodes = list(G.nodes)
+    index = {node: i for (i, node) in enumerate(nodes)}
+    rot = [[index[neighbour] for neighbour in rotation[node]] for node in nodes]
+    red_root, green_root, blue_root = outer_face
+    parents = wood_parents(rot, index[red_root], index[green_root], index[blue_root], minimal, nodes)
+    
+    edges = dict()
+    for colour in Colour:
+        edges[colour] = [(nodes[v], nodes[parent]) for (v, parent) in enumerate(parents[colour]) if parent != -1]
+    return Schnyder(G, red_root, edges[Colour.RED], green_root, edges[Colour.GREEN], blue_root, edges[Colour.BLUE], compact=compact)
+
+def wood_parents(rot, red_root, green_root, blue_root, minimal=True, nodes=None):
+    # Nodes are 0..n-1 and rot[v] lists the neighbours of v in rotation order; nodes optionally
+    # holds their labels for error messages.
+    # Returns {colour: parent list}, with -1 for the three roots.
+    n = len(rot)
+    if nodes is None:
+        nodes = range(n)
+    outer_face = (nodes[red_root], nodes[green_root], nodes[blue_root])
+    # P runs from start to end; contracting near end gives the minimal wood
+    if minimal:
+        start_colour, end_colour = Colour.GREEN, Colour.BLUE
+        a, b, c = red_root, green_root, blue_root
+    else:
+        start_colour, end_colour = Colour.BLUE, Colour.GREEN
+        a, b, c = red_root, blue_root, green_root
+    
+    # Initial P: neighbours of the red root, read from start to end the way that avoids the outer edge
+    around = rot[a]
+    if b not in around or c not in around:
+        raise Exception(f'{outer_face} is not a face')
+    d = len(around)
+    i = around.index(b)
+    step = -1 if around[(i + 1) % d] == c else 1
+    path = [around[(i + step * k) % d] for k in range(d)]
+    if path[-1] != c:
+        raise Exception(f'{outer_face} is not a face')
+    
+    on_path = [False] * n
+    alive = [True] * n
+    alive[a] = False
+    prev = [-1] * n
+    next = [-1] * n
+    chords = [0] * n
+    for (k, v) in enumerate(path):
+        on_path[v] = True
+        if k > 0:
+            prev[v] = path[k - 1]
+            next[path[k - 1]] = v
+    for v in path:
+        for w in rot[v]:
+            if on_path[w] and w != prev[v] and w != next[v]:
+                chords[v] += 1
+    
+    parents = {colour: [-1] * n for colour in Colour}
+    red_parent = parents[Colour.RED]
+    for v in path[1:-1]:
+        red_parent[v] = a
+    # Contractible candidates in path order, top nearest the end; stale entries are skipped
+    stack = [v for v in path[1:-1] if chords[v] == 0]
+    while stack:
+        x = stack.pop()
+        if not on_path[x] or chords[x] != 0:
+            continue
+        left, right = prev[x], next[x]
+        
+        # Neighbours strictly between left and right on the side away from the contracted vertices
+        around = rot[x]
+        d = len(around)
+        i = around.index(left)
+        middle = []
+        for k in range(1, d):
+            w = around[(i + k) % d]
+            if w == right:
+                break
+            if not alive[w]:
+                middle = None
+                break
+            middle.append(w)
+        if middle is None:
+            middle = []
+            for k in range(1, d):
+                w = around[(i - k) % d]
+                if w == right:
+                    break
+                middle.append(w)
+        
+        parents[start_colour][x] = left
+        parents[end_colour][x] = right
+        alive[x] = False
+        on_path[x] = False
+        
+        if len(middle) == 0:
+            # The edge left-right stops being a chord
+            next[left] = right
+            prev[right] = left
+            chords[left] -= 1
+            chords[right] -= 1
+        else:
+            chain = [left] + middle + [right]
+            for k in range(1, len(chain)):
+                prev[chain[k]] = chain[k - 1]
+                next[chain[k - 1]] = chain[k]
+            for y in middle:
+                red_parent[y] = x
+                on_path[y] = True
+                for w in rot[y]:
+                    if on_path[w] and w != y and w != prev[y] and w != next[y]:
+                        chords[y] += 1
+                        chords[w] += 1
+        
+        for v in [left] + middle + [right]:
+            if v != b and v != c and chords[v] == 0:
+                stack.append(v)
+    
+    if any(alive[v] for v in range(n) if v != b and v != c):
+        raise Exception('Contraction did not reach every vertex')
+    return parents
@@ -0,0 +1,35 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# NumPy arrays in multiprocessing.shared_memory, so worker processes can map them by name
+# instead of receiving pickled copies.
+
+def share_arrays(arrays):
+    # Copies {name: array} into new shared memory blocks.
+    # Returns (blocks, specs); the caller must close and unlink the blocks when done.
+    blocks = []
+    specs = dict()
+    for (name, array) in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def attach_arrays(specs):
+    # Maps the blocks described by specs; returns (blocks, {name: array}).
+    # Keep the blocks referenced for as long as the arrays are used. Meant for child processes
+    # of the creator, which share its resource tracker, so attaching does not take ownership.
+    blocks = []
+    arrays = dict()
+    for (name, (block_name, shape, dtype)) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+def release(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
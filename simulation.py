@@ -0,0 +1,172 @@
+import heapq
+import itertools
+from array import array
+import numpy as np
+
+import csr
+
+# Discrete-event simulation of packet flows forwarded by Schnyder local routing.
+#
+# Every directed link is a FIFO queue served at `capacity` packets per unit time, followed by a
+# fixed propagation delay. A link is fully described by the time its queue drains, so a packet
+# handed to a link at time t starts transmission at max(t, busy_until) and arrives at the next
+# node one service time plus the propagation delay later; the backlog it sees is
+# (busy_until - t) * capacity packets, and it is dropped when that reaches `buffer`.
+# Each flow injects packets as a Poisson process. Local routing is deterministic, so every
+# packet of a flow takes the same path: paths for all flows come from one
+# CompiledRouter.route_batch call, and each hop then costs one heap push and pop.
+#
+# Links are numbered by their position in CompiledRouter.edge_key_table, link i being the edge
+# u -> v with u * n + v == edge_keys[i].
+
+INJECT = 0
+ARRIVE = 1
+
+def summarize(values):
+    if len(values) == 0:
+        return {'count': 0}
+    values = np.frombuffer(values, dtype=np.float64)
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max())
+    }
+
+class Simulation:
+
+    def __init__(self, router, capacity=1.0, propagation=0.0, buffer=None):
+        # capacity is a number or an array over links
+        self.router = router
+        self.edge_keys = router.edge_key_table()
+        self.capacity = np.broadcast_to(np.asarray(capacity, dtype=np.float64), (len(self.edge_keys),))
+        self.propagation = propagation
+        self.buffer = buffer
+        self.flows = []
+
+    def add_flow(self, src, dest, rate, start=0.0, stop=None):
+        # src and dest are node indices; rate is the mean number of packets per unit time
+        if src == dest:
+            raise Exception('Flow source and destination must differ')
+        if not rate > 0:
+            raise Exception(f'Flow rate must be positive, got {rate}')
+        self.flows.append((src, dest, rate, start, stop))
+
+    def paths(self):
+        # (offsets, nodes, links): flow f visits nodes[offsets[f]:offsets[f + 1]] and leaves
+        # nodes[k] over links[k]
+        R = self.router
+        src = np.array([flow[0] for flow in self.flows], dtype=np.int64)
+        dest = np.array([flow[1] for flow in self.flows], dtype=np.int64)
+        hops, offsets, nodes = R.route_batch(src, dest, return_paths=True)
+        failed = np.flatnonzero(hops < 0)
+        if len(failed) > 0:
+            pairs = [(R.nodes[src[f]], R.nodes[dest[f]]) for f in failed[:10].tolist()]
+            raise Exception(f'Routing does not deliver {len(failed)} flows, including {pairs}')
+        following = np.append(nodes[1:], -1)
+        links = np.searchsorted(self.edge_keys, nodes * R.n + following)
+        links[offsets[1:] - 1] = -1
+        return offsets, nodes, links
+
+    def run(self, duration, seed=None, top=10):
+        rng = np.random.default_rng(seed)
+        n = self.router.n
+        offsets, nodes, links = self.paths()
+        last = (offsets[1:] - 1).tolist()
+        offsets, path_links = offsets.tolist(), links.tolist()
+        service = (1.0 / self.capacity).tolist()
+        propagation = self.propagation
+        buffer = self.buffer
+        busy_until = [0.0] * len(service)
+        sent = [0] * len(service)
+        max_backlog = [0.0] * len(service)
+        latency = array('d')
+        waiting = array('d')
+        hop_counts = array('d')
+        injected = dropped = events = 0
+
+        # Events are (time, sequence number, kind, flow, position in path, birth time, time queued)
+        heap = []
+        counter = itertools.count().__next__
+        for (f, (src, dest, rate, start, stop)) in enumerate(self.flows):
+            arrival = start + rng.exponential(1 / rate)
+            if stop is None or arrival < stop:
+                heapq.heappush(heap, (arrival, counter(), INJECT, f, offsets[f], 0.0, 0.0))
+        while len(heap) > 0:
+            time, _, kind, f, p, born, waited = heapq.heappop(heap)
+            if time > duration:
+                heapq.heappush(heap, (time, counter(), kind, f, p, born, waited))
+                break
+            events += 1
+            if kind == INJECT:
+                src, dest, rate, start, stop = self.flows[f]
+                arrival = time + rng.exponential(1 / rate)
+                if stop is None or arrival < stop:
+                    heapq.heappush(heap, (arrival, counter(), INJECT, f, p, 0.0, 0.0))
+                injected += 1
+                born = time
+            elif p == last[f]:
+                latency.append(time - born)
+                waiting.append(waited)
+                hop_counts.append(p - offsets[f])
+                continue
+            i = path_links[p]
+            start = busy_until[i] if busy_until[i] > time else time
+            backlog = (start - time) / service[i]
+            if buffer is not None and backlog >= buffer:
+                dropped += 1
+                continue
+            if backlog > max_backlog[i]:
+                max_backlog[i] = backlog
+            busy_until[i] = start + service[i]
+            sent[i] += 1
+            heapq.heappush(heap, (busy_until[i] + propagation, counter(), ARRIVE, f, p + 1, born, waited + start - time))
+        in_flight = sum(1 for event in heap if event[2] == ARRIVE)
+        sent = np.array(sent)
+        # Busy time inside [0, duration]; a queue still busy at the end has been busy throughout
+        # the tail of its backlog
+        busy = sent / self.capacity - np.maximum(np.array(busy_until) - duration, 0)
+        forwarded = np.bincount(self.edge_keys // n, weights=sent, minlength=n).astype(np.int64)
+        return self.report(duration, injected, dropped, in_flight, events, latency, waiting, hop_counts,
+                           sent, busy / duration, np.array(max_backlog), forwarded, top)
+
+    def report(self, duration, injected, dropped, in_flight, events, latency, waiting, hop_counts, sent, utilisation, max_backlog, forwarded, top):
+        R = self.router
+        n = R.n
+        busiest = np.argsort(-utilisation, kind='stable')[:top].tolist()
+        # Hot spots and their hop distance to the nearest root
+        roots = np.flatnonzero((R.parents < 0).all(axis=0))
+        root_distance = csr.bfs_distances(R.indptr, R.indices, roots).min(axis=0)
+        hottest = np.argsort(-forwarded, kind='stable')[:top].tolist()
+        total = max(int(forwarded.sum()), 1)
+        return {
+            'duration': duration,
+            'events': events,
+            'injected': injected,
+            'delivered': len(latency),
+            'dropped': dropped,
+            'in_flight': in_flight,
+            'throughput': len(latency) / duration,
+            'latency': summarize(latency),
+            'queueing_delay': summarize(waiting),
+            'hops': summarize(hop_counts),
+            'links': {
+                'utilisation_mean': float(utilisation.mean()),
+                'utilisation_max': float(utilisation.max()),
+                'busiest': [{'source': R.nodes[self.edge_keys[i] // n], 'target': R.nodes[self.edge_keys[i] % n], 'utilisation': float(utilisation[i]),
+                             'packets': int(sent[i]), 'max_backlog': float(max_backlog[i])} for i in busiest]
+            },
+            'hot_spots': [{'node': R.nodes[i], 'forwarded': int(forwarded[i]), 'root_distance': int(root_distance[i])} for i in hottest],
+            # Share of all forwarding done by the roots and their neighbours
+            'near_root_share': float(forwarded[root_distance <= 1].sum() / total)
+        }
+
+def random_flows(simulation, count, rate, seed=None):
+    # Adds count flows between distinct random node pairs, each with the given rate
+    rng = np.random.default_rng(seed)
+    n = simulation.router.n
+    src = rng.integers(0, n, size=count)
+    dest = (src + rng.integers(1, n, size=count)) % n
+    for (s, t) in zip(src.tolist(), dest.tolist()):
+        simulation.add_flow(s, t, rate)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+import edgelist
+import localroute
+import schnyder
+from colour import Colour
+
+# Binary on-disk format for Schnyder woods, mapped with np.memmap so loading copies nothing.
+#
+# Layout: 8 byte magic, 4 byte little-endian header length, a JSON header, zero padding to
+# HEADER_SIZE, then each array at a 64 byte aligned offset recorded in the header.
+# Arrays: labels (n,) int64, indptr (n + 1,) and indices (2m,) for the adjacency in G.adj
+# order, parents (3, n) with -1 at the roots and columns ordered by col_index, and optionally
+# coords (n, 3), the Schnyder coordinates from Data.compute_all.
+
+MAGIC = b'SCHNYDR1'
+HEADER_SIZE = 4096
+ALIGNMENT = 64
+
+def save(filename, G, S, coords=True):
+    R = localroute.compile_router(G, S)
+    try:
+        labels = np.array(R.nodes, dtype=np.int64)
+    except (TypeError, ValueError, OverflowError):
+        raise Exception('Only integer node labels can be stored')
+    arrays = {
+        'labels': labels,
+        'indptr': R.indptr,
+        'indices': R.indices,
+        'parents': R.parents
+    }
+    if coords:
+        arrays['coords'] = R.coords
+    roots = {colour.name.lower(): int(S.woods.root(colour)) for colour in Colour}
+    write_arrays(filename, arrays, roots)
+
+def write_arrays(filename, arrays, roots):
+    header = {'roots': roots, 'arrays': dict()}
+    offset = HEADER_SIZE
+    for (name, array) in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    encoded = json.dumps(header).encode()
+    if len(encoded) + 12 > HEADER_SIZE:
+        raise Exception('Header too large')
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(4, 'little'))
+        f.write(encoded)
+        for (name, array) in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(max(offset, HEADER_SIZE))
+
+class StoredWoods:
+    # A file opened by load; arrays are read-only views into the mapping
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            if f.read(8) != MAGIC:
+                raise Exception(f'{filename} is not a Schnyder woods file')
+            length = int.from_bytes(f.read(4), 'little')
+            header = json.loads(f.read(length))
+        self.filename = filename
+        self.mapping = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.arrays = dict()
+        for (name, spec) in header['arrays'].items():
+            self.arrays[name] = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=self.mapping, offset=spec['offset'])
+        self.roots = {colour: header['roots'][colour.name.lower()] for colour in Colour}
+        self.labels = self.arrays['labels']
+        self.indptr = self.arrays['indptr']
+        self.indices = self.arrays['indices']
+        self.parents = self.arrays['parents']
+        self.coords = self.arrays.get('coords')
+        self.n = len(self.labels)
+
+    def woods(self):
+        return schnyder.CompactWoods.from_parents(self.labels.tolist(), self.parents,
+                                                  self.roots[Colour.RED], self.roots[Colour.GREEN], self.roots[Colour.BLUE])
+
+    def router(self):
+        coords = self.coords
+        if coords is None:
+            coords = schnyder.Data(self.woods()).compute_all()
+        return localroute.CompiledRouter(self.labels.tolist(), self.indptr, self.indices, self.parents, coords)
+
+def load(filename):
+    return StoredWoods(filename)
+
+def convert_edgelist(source, filename, coords=True):
+    # Converts a Sage-format edgelist to the binary format
+    G, S = edgelist.read_schnyder(source, compact=True)
+    save(filename, G, S, coords)
+
+# Parse cache: binary files named by the SHA-256 of the source edgelist
+
+def file_hash(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_path(cache_dir, digest):
+    return os.path.join(cache_dir, f'{digest}.schnyder')
+
+def load_edgelist_cached(edgelist, cache_dir='.schnyder_cache', digest=None):
+    # digest, when the caller already has the file's hash, saves reading the file again
+    os.makedirs(cache_dir, exist_ok=True)
+    cached = cache_path(cache_dir, digest if digest is not None else file_hash(edgelist))
+    if not os.path.exists(cached):
+        # Write to a temporary name first so an interrupted run never leaves a partial cache entry
+        partial = f'{cached}.{os.getpid()}.tmp'
+        convert_edgelist(edgelist, partial)
+        os.replace(partial, cached)
+    return load(cached)
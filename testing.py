@@ -1,10 +1,32 @@
 import unittest
+import os
+import itertools
+import re
+import tempfile
+import json
+import networkx as nx
+import numpy as np
 import schnyder
+import csr
 import localroute
 import example1 as ex1
 import example2 as ex2
 import evaluation
-from colour import Colour
+import distortion
+import triangulation
+import storage
+import edgelist
+import benchmark
+import instrument
+import validation
+import drawing
+import labels
+import simulation
+import ancestry
+import matrices
+import worstcase
+import verify
+from colour import Colour, col_index
 
 class TestSchnyderData(unittest.TestCase):
     
@@ -99,6 +121,148 @@ class TestRouting(unittest.TestCase):
                 routing_path = localroute.schnyder_local_route(ex2.G, self.S2, s, t)
                 assert is_valid_walk(ex2.G, s, t, routing_path)
 
+class TestCompactWoods(unittest.TestCase):
+    
+    def setUp(self):
+        self.subtests = []
+        for i in [1, 2, 3, 4]:
+            _, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist')
+            G, C = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist', compact=True)
+            self.subtests.append((G, S, C))
+        
+    def test_matches_woods(self):
+        for subtest in self.subtests:
+            G, S, C = subtest
+            for colour in Colour:
+                assert C.woods.root(colour) == S.woods.root(colour)
+                for node in G.nodes:
+                    assert set(C.woods.children(colour, node)) == set(S.woods.children(colour, node))
+                    if node not in S.woods.roots:
+                        assert C.woods.parent(colour, node) == S.woods.parent(colour, node)
+                        assert C.woods.path_nodes(colour, node) == S.woods.path_nodes(colour, node)
+    
+    def test_same_routes(self):
+        for subtest in self.subtests:
+            G, S, C = subtest
+            for s in G.nodes:
+                for t in G.nodes:
+                    assert localroute.schnyder_local_route(G, C, s, t) == localroute.schnyder_local_route(G, S, s, t)
+
+def stacked_path(k):
+    # Each new vertex goes in the face under the previous one, so the red path has length k
+    red_edges = [(1, 'r')] + [(i, i - 1) for i in range(2, k + 1)]
+    green_edges = [(i, 'g') for i in range(1, k + 1)]
+    blue_edges = [(i, 'b') for i in range(1, k + 1)]
+    G = nx.Graph()
+    G.add_edges_from([('r', 'g'), ('g', 'b'), ('b', 'r')])
+    G.add_edges_from(red_edges + green_edges + blue_edges)
+    return schnyder.Schnyder(G, 'r', red_edges, 'g', green_edges, 'b', blue_edges)
+
+class TestComputeAll(unittest.TestCase):
+    
+    def setUp(self):
+        self.subtests = []
+        for i in [1, 2, 3, 4]:
+            G, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist')
+            self.subtests.append((G, S))
+        
+    def test_matches_memoized(self):
+        for subtest in self.subtests:
+            G, S = subtest
+            memoized = schnyder.Data(S.woods)
+            coords = S.data.compute_all()
+            assert coords.shape == (G.number_of_nodes(), 3)
+            for node in G.nodes:
+                for colour in Colour:
+                    assert S.data.subtree_size(colour, node) == memoized.subtree_size(colour, node)
+                    assert S.data.region_size_nodes(colour, node) == memoized.region_size_nodes(colour, node)
+                    assert S.data.region_size_triangles(colour, node) == memoized.region_size_triangles(colour, node)
+                    if node == S.woods.root(colour) or node not in S.woods.roots:
+                        assert S.data.path_length(colour, node) == memoized.path_length(colour, node)
+                if node not in S.woods.roots:
+                    for (col_tree, col_path) in itertools.permutations(Colour, 2):
+                        assert S.data.subtree_size_path_sum(col_tree, col_path, node) == memoized.subtree_size_path_sum(col_tree, col_path, node)
+    
+    def test_deep_tree(self):
+        k = 5000
+        S = stacked_path(k)
+        S.data.compute_all()
+        assert S.data.path_length(Colour.RED, k) == k
+        assert S.data.subtree_size(Colour.RED, 1) == k
+        assert S.data.region_size_triangles(Colour.RED, 'r') == 2 * (k + 3) - 5
+        assert S.data.region_size_triangles(Colour.RED, k) + S.data.region_size_triangles(Colour.GREEN, k) + S.data.region_size_triangles(Colour.BLUE, k) == 2 * (k + 3) - 5
+
+class TestFromTriangulation(unittest.TestCase):
+    
+    def setUp(self):
+        self.subtests = []
+        for i in [1, 2, 3, 4]:
+            G, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist')
+            self.subtests.append((G, S))
+    
+    def test_matches_sage_minimal_wood(self):
+        for subtest in self.subtests:
+            G, S = subtest
+            T = schnyder.from_triangulation(G, (-3, -1, -2))
+            for colour in Colour:
+                assert set(T.woods.tree_map[colour].edges) == set(S.woods.tree_map[colour].edges)
+    
+    def test_edge_array_input(self):
+        G, S = self.subtests[3]
+        T = schnyder.from_triangulation(list(G.edges), (-3, -1, -2), compact=True)
+        for node in G.nodes:
+            for colour in Colour:
+                assert T.data.region_size_triangles(colour, node) == S.data.region_size_triangles(colour, node)
+    
+    def test_maximal_wood_routes(self):
+        G, S = self.subtests[3]
+        T = schnyder.from_triangulation(G, (-3, -1, -2), minimal=False)
+        for s in G.nodes:
+            for t in G.nodes:
+                assert is_valid_walk(G, s, t, localroute.schnyder_local_route(G, T, s, t))
+    
+    def test_not_triangulation(self):
+        G = nx.cycle_graph(5)
+        with self.assertRaises(Exception):
+            schnyder.from_triangulation(G, (0, 1, 2))
+    
+    def test_not_a_face(self):
+        G, S = self.subtests[3]
+        far = [node for node in G.nodes if not G.has_edge(-3, node) and node != -3][0]
+        with self.assertRaisesRegex(Exception, re.escape(f'{(-3, -1, far)} is not a face')):
+            schnyder.from_triangulation(G, (-3, -1, far))
+
+class TestRandomTriangulation(unittest.TestCase):
+    
+    def test_triangulation(self):
+        edges, rotation = triangulation.random_triangulation(200, seed=1)
+        G = nx.Graph()
+        G.add_edges_from(edges.tolist())
+        assert G.number_of_nodes() == 200 and G.number_of_edges() == 3 * 200 - 6
+        assert nx.check_planarity(G)[0]
+        assert {-1, -2, -3} <= set(G.nodes)
+        S = schnyder.from_triangulation(edges, (-3, -1, -2), rotation=rotation)
+        T = schnyder.from_triangulation(G, (-3, -1, -2))
+        for colour in Colour:
+            assert set(S.woods.tree_map[colour].edges) == set(T.woods.tree_map[colour].edges)
+    
+    def test_seeded(self):
+        a = triangulation.random_wood(100, seed=7)
+        b = triangulation.random_wood(100, seed=7)
+        for colour in Colour:
+            assert (a[colour] == b[colour]).all()
+    
+    def test_edgelist_routes(self):
+        filename = 'test-random.edgelist'
+        try:
+            triangulation.write_wood_edgelist(triangulation.random_wood(60, seed=3), filename)
+            G, S = evaluation.parse_edgelist_to_schnyder(filename)
+        finally:
+            os.remove(filename)
+        for s in G.nodes:
+            for t in G.nodes:
+                assert is_valid_walk(G, s, t, localroute.schnyder_local_route(G, S, s, t))
+
 class TestRoutingFile(unittest.TestCase):
     
     def setUp(self):
@@ -116,6 +280,111 @@ class TestRoutingFile(unittest.TestCase):
                     routing_path = localroute.schnyder_local_route(G, S, s, t)
                     assert is_valid_walk(G, s, t, routing_path)
 
+class TestCompiledRouter(unittest.TestCase):
+    
+    def setUp(self):
+        self.subtests = []
+        for i in [1, 2, 3, 4]:
+            G, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist')
+            self.subtests.append((G, S))
+        S1 = schnyder.Schnyder(ex1.G, ex1.red_root, ex1.red_edges, ex1.green_root, ex1.green_edges, ex1.blue_root, ex1.blue_edges)
+        self.subtests.append((ex1.G, S1))
+    
+    def test_same_paths(self):
+        for subtest in self.subtests:
+            G, S = subtest
+            R = localroute.compile_router(G, S)
+            for s in G.nodes:
+                for t in G.nodes:
+                    assert R.route(s, t) == localroute.schnyder_local_route(G, S, s, t)
+                    if s != t:
+                        assert R.next_hop(s, t) == localroute.schnyder_next(G, S, s, t)
+    
+    def test_batch_paths(self):
+        for subtest in self.subtests:
+            G, S = subtest
+            R = localroute.compile_router(G, S)
+            pairs = list(itertools.product(G.nodes, G.nodes))
+            src = R.indices_of([s for (s, t) in pairs])
+            dest = R.indices_of([t for (s, t) in pairs])
+            hops, offsets, nodes = R.route_batch(src, dest, return_paths=True)
+            for (i, (s, t)) in enumerate(pairs):
+                path = localroute.schnyder_local_route(G, S, s, t)
+                assert hops[i] == len(path)
+                assert [R.nodes[node] for node in nodes[offsets[i]:offsets[i + 1]]] == [s] + [v for (u, v) in path]
+            assert (R.route_batch(src, dest) == hops).all()
+    
+    def test_fixed_dest(self):
+        for subtest in self.subtests:
+            G, S = subtest
+            R = localroute.compile_router(G, S)
+            for t in G.nodes:
+                T = localroute.fixed_dest_routing_tree(G, S, t)
+                next_hops = R.next_hops(R.index[t])
+                distances = localroute.routing_distances(next_hops, R.index[t])
+                for (i, s) in enumerate(R.nodes):
+                    if s != t:
+                        assert list(T.successors(s)) == [R.nodes[next_hops[i]]]
+                    assert distances[i] == len(localroute.schnyder_local_route(G, S, s, t))
+    
+    def test_batch_hop_limit(self):
+        G, S = self.subtests[3]
+        R = localroute.compile_router(G, S)
+        src = np.repeat(np.arange(R.n), R.n)
+        dest = np.tile(np.arange(R.n), R.n)
+        hops = R.route_batch(src, dest)
+        limited = R.route_batch(src, dest, max_hops=2)
+        assert (limited == np.where(hops <= 2, hops, -1)).all()
+
+class TestRouteCache(unittest.TestCase):
+    
+    def test_same_paths(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        cache = localroute.route_cache(G, S)
+        for t in G.nodes:
+            for s in G.nodes:
+                assert cache.route(s, t) == localroute.schnyder_local_route(G, S, s, t)
+                if s != t:
+                    assert cache.next_hop(s, t) == localroute.schnyder_next(G, S, s, t)
+        stats = cache.stats()
+        assert stats['misses'] == G.number_of_nodes()
+        assert stats['hits'] == 2 * G.number_of_nodes() ** 2 - 2 * G.number_of_nodes()
+    
+    def test_eviction(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        R = localroute.compile_router(G, S)
+        cache = localroute.RouteCache(R, max_bytes=2 * 4 * R.n)
+        cache.next_hops(0)
+        cache.next_hops(1)
+        cache.next_hops(0)
+        cache.next_hops(2)
+        assert list(cache.tables) == [0, 2]
+        assert cache.stats()['evictions'] == 1 and cache.bytes <= cache.max_bytes
+        assert (cache.next_hops(1) == R.next_hops(1)).all()
+        assert cache.stats()['misses'] == 4 and cache.stats()['hits'] == 1
+
+class TestBFS(unittest.TestCase):
+    
+    def test_matches_networkx(self):
+        for i in [1, 2, 3, 4]:
+            G, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist')
+            nodes = list(G.nodes)
+            index = {node: i for (i, node) in enumerate(nodes)}
+            indptr, indices = csr.graph_to_csr(G, index)
+            out = np.zeros((len(nodes), len(nodes)), dtype=np.int32)
+            distances = csr.bfs_distances(indptr, indices, np.arange(len(nodes)), out=out)
+            assert distances is out
+            for s in nodes:
+                for (t, d) in nx.single_source_shortest_path_length(G, s).items():
+                    assert distances[index[s], index[t]] == d
+            limited = csr.bfs_distances(indptr, indices, np.arange(len(nodes)), max_depth=2)
+            assert (limited == np.where(distances <= 2, distances, -1)).all()
+    
+    def test_routing_distances_cycles(self):
+        # 1 -> 2 -> 0, 3 -> 4 -> 3 cycles, 5 has no next hop and 6 leads to it
+        next_hops = np.array([0, 2, 0, 4, 3, -1, 5])
+        assert localroute.routing_distances(next_hops, 0).tolist() == [0, 2, 1, -1, -1, -1, -1]
+
 class TestEval(unittest.TestCase):
     
     def setUp(self):
@@ -131,6 +400,541 @@ class TestEval(unittest.TestCase):
             distortion2 = evaluation.evaluate_routing_protocol_faster(G, S)
             assert len(distortion1) == len(distortion2)
             assert distortion1 == distortion2, f'\nd1: {distortion1}\nd2: {distortion2}'
+    
+    def test_streaming_matches_dict(self):
+        for subtest in self.subtests:
+            G, S = subtest
+            full = evaluation.evaluate_routing_protocol_faster(G, S)
+            values = sorted(full.values())
+            stats = evaluation.evaluate_routing_protocol_streaming(G, S, worst_k=3)
+            assert stats.count() == len(values)
+            assert stats.min() == values[0] and stats.max() == values[-1]
+            assert abs(stats.mean() - sum(values) / len(values)) < 1e-9
+            assert stats.quantile(0.5) == values[int(np.ceil(0.5 * len(values))) - 1]
+            assert stats.histogram(bins=5)[0].sum() == len(values)
+            for (d, s, t) in stats.worst(list(G.nodes)):
+                assert full[(s, t)] == d
+            assert [d for (d, s, t) in stats.worst()] == values[::-1][:3]
+    
+    def test_parallel_matches_serial(self):
+        G, S = self.subtests[3]
+        serial = evaluation.evaluate_routing_protocol_streaming(G, S)
+        parallel = evaluation.evaluate_routing_protocol_parallel(G, S, processes=2, shards=3)
+        assert (parallel.counts == serial.counts).all()
+        assert parallel.max() == serial.max()
+    
+    def test_streaming_merge(self):
+        G, S = self.subtests[3]
+        R = localroute.compile_router(G, S)
+        whole = evaluation.evaluate_destinations(R, np.arange(R.n))
+        half = evaluation.evaluate_destinations(R, np.arange(R.n // 2))
+        rest = distortion.from_dict(evaluation.evaluate_destinations(R, np.arange(R.n // 2, R.n)).to_dict())
+        merged = half.merge(rest)
+        assert (merged.counts == whole.counts).all()
+        assert [d for (d, s, t) in merged.worst()] == [d for (d, s, t) in whole.worst()]
+
+class TestStorage(unittest.TestCase):
+    
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'unittest4.schnyder')
+            storage.convert_edgelist('unittest4.edgelist', filename)
+            stored = storage.load(filename)
+            assert isinstance(stored.mapping, np.memmap)
+            G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+            R = localroute.compile_router(G, S)
+            assert stored.labels.tolist() == R.nodes
+            assert (stored.indptr == R.indptr).all() and (stored.indices == R.indices).all()
+            assert (stored.parents == R.parents).all() and (stored.coords == R.coords).all()
+            loaded = stored.router()
+            for (s, t) in itertools.product(R.nodes, R.nodes):
+                assert loaded.route(s, t) == R.route(s, t)
+    
+    def test_coords_recomputed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'unittest3.schnyder')
+            storage.convert_edgelist('unittest3.edgelist', filename, coords=False)
+            stored = storage.load(filename)
+            assert stored.coords is None
+            G, S = evaluation.parse_edgelist_to_schnyder('unittest3.edgelist')
+            R = localroute.compile_router(G, S)
+            assert (stored.router().coords == R.coords).all()
+    
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first = storage.load_edgelist_cached('unittest2.edgelist', cache_dir=tmp)
+            second = storage.load_edgelist_cached('unittest2.edgelist', cache_dir=tmp)
+            assert first.filename == second.filename
+            assert os.listdir(tmp) == [os.path.basename(first.filename)]
+
+class TestEdgelist(unittest.TestCase):
+    
+    def test_matches_networkx(self):
+        for filename in [f'unittest{i}.edgelist' for i in [1, 2, 3, 4]] + ['eval-n100-1.edgelist']:
+            G1, S1 = evaluation.parse_edgelist_to_schnyder_networkx(filename)
+            G2, S2 = evaluation.parse_edgelist_to_schnyder(filename)
+            assert list(G1.nodes) == list(G2.nodes)
+            assert [list(G1.adj[u]) for u in G1] == [list(G2.adj[u]) for u in G2]
+            for colour in Colour:
+                assert list(S1.woods.tree_map[colour].edges) == list(S2.woods.tree_map[colour].edges)
+    
+    def test_chunks(self):
+        whole = edgelist.read_wood_edgelist('eval-n100-1.edgelist')
+        chunked = edgelist.read_wood_edgelist('eval-n100-1.edgelist', chunk_size=100)
+        for (a, b) in zip(whole, chunked):
+            assert (a == b).all()
+        assert whole[0][-3:].tolist() == [-1, -2, -3] and whole[2][-3:].tolist() == [0, 0, 0]
+    
+    def test_bad_colour(self):
+        with self.assertRaises(Exception):
+            edgelist.parse_chunk(b"3 -3 {'weight': 'purple'}\n")
+
+class TestIncremental(unittest.TestCase):
+    
+    def inner_faces(self, G):
+        _, embedding = nx.check_planarity(G)
+        faces = {tuple(sorted(embedding.traverse_face(u, v))) for (u, v) in embedding.edges()}
+        return sorted(face for face in faces if len(face) == 3)
+    
+    def check(self, G, S):
+        fresh = schnyder.Data(S.woods)
+        coords = fresh.compute_all()
+        for u in G:
+            for colour in Colour:
+                assert S.data.region_size_triangles(colour, u) == coords[fresh.index[u], col_index(colour)]
+                assert S.data.subtree_size(colour, u) == fresh.subtree_size(colour, u)
+        R = localroute.compile_router(G, S)
+        hops = R.route_batch(np.repeat(np.arange(R.n), R.n), np.tile(np.arange(R.n), R.n))
+        assert (hops >= 0).all()
+    
+    def run_changes(self, compute_all):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        if compute_all:
+            S.data.compute_all()
+        else:
+            S.data.region_size_triangles(Colour.RED, 3)
+        flips = 0
+        inserted = 0
+        for step in range(10):
+            for face in self.inner_faces(G)[step::3]:
+                try:
+                    S.data.flip_face(face)
+                    flips += 1
+                    break
+                except Exception:
+                    pass
+            for face in self.inner_faces(G)[step::5]:
+                try:
+                    S.data.insert_vertex(1000 + inserted, face)
+                    inserted += 1
+                    break
+                except Exception:
+                    pass
+            self.check(G, S)
+        assert flips == 10 and inserted == 10
+    
+    def test_memoized(self):
+        self.run_changes(False)
+    
+    def test_arrays(self):
+        self.run_changes(True)
+    
+    def test_outer_face(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest1.edgelist')
+        with self.assertRaises(Exception):
+            S.data.insert_vertex(100, (-1, -2, -3))
+    
+    def test_separating_triangle(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        assert G.has_edge(31, 32) and G.has_edge(32, 33) and G.has_edge(33, 31)
+        assert (31, 32, 33) not in self.inner_faces(G)
+        with self.assertRaises(Exception):
+            S.data.flip_face((31, 32, 33))
+        with self.assertRaises(Exception):
+            S.data.insert_vertex(999, (31, 32, 33))
+        assert not G.has_node(999)
+        assert validation.validate_wood(G, S.woods) == dict()
+        planar, _ = nx.check_planarity(G)
+        assert planar
+        assert all(S.woods.is_face(face) for face in self.inner_faces(G))
+    
+    def test_compact_read_only(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist', compact=True)
+        face = self.inner_faces(G)[0]
+        with self.assertRaisesRegex(Exception, 'read-only'):
+            S.data.insert_vertex(999, face)
+        with self.assertRaisesRegex(Exception, 'read-only'):
+            S.data.flip_face(face)
+
+class TestBenchmark(unittest.TestCase):
+    
+    def test_run_and_compare(self):
+        report = benchmark.run([50], repeat=1, routes=10, destinations=2)
+        results = report['results']['50']
+        assert results['route_latency']['samples'] == 10
+        assert results['route_latency_memoized']['samples'] == 10
+        assert results['evaluate_routing_protocol_faster']['median'] > 0
+        slower = json.loads(json.dumps(report))
+        slower['results']['50']['compute_all']['median'] *= 2
+        rows = benchmark.compare(slower, report)
+        regressed = [(name, field) for (n, name, field, old, new, ratio, flag) in rows if flag]
+        assert regressed == [('compute_all', 'median')]
+
+class TestInstrument(unittest.TestCase):
+    
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+    
+    def test_disabled(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        localroute.schnyder_local_route(G, S, 3, 5)
+        assert instrument.summary() == {'counters': {}, 'distributions': {}, 'phases': {}}
+    
+    def test_routing_counters(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        instrument.enable()
+        hops = 0
+        for (s, t) in itertools.product(G.nodes, G.nodes):
+            hops += len(localroute.schnyder_local_route(G, S, s, t))
+        summary = instrument.summary()
+        counters = summary['counters']
+        assert counters['next.adjacent'] + counters['next.pure'] + counters['next.anti'] == hops
+        assert summary['distributions']['next.anti.scan']['count'] == counters['next.anti']
+        assert summary['distributions']['route.hops']['count'] == G.number_of_nodes() ** 2
+        assert counters['memo.region_size_triangles.miss'] == 3 * G.number_of_nodes()
+        assert counters['woods.parent'] > 0
+    
+    def test_phases(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        instrument.enable()
+        evaluation.evaluate_test('unittest4.edgelist')
+        phases = json.loads(instrument.to_json())['phases']
+        assert set(phases) == {'parse', 'compile', 'bfs', 'routing', 'statistics'}
+        assert phases['routing']['calls'] == G.number_of_nodes()
+
+class TestValidation(unittest.TestCase):
+    
+    def test_valid(self):
+        for i in [1, 2, 3, 4]:
+            for compact in [False, True]:
+                G, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist', compact=compact)
+                assert validation.validate_wood(G, S.woods) == dict()
+        for seed in range(3):
+            edges, rotation = triangulation.random_triangulation(60, seed)
+            S = schnyder.from_triangulation(edges, (-3, -1, -2), rotation=rotation)
+            assert validation.validate_wood(S.G, S.woods, rotation) == dict()
+    
+    def test_moved_edge(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        old = S.woods.parent(Colour.RED, 3)
+        new = S.woods.parent(Colour.BLUE, 3)
+        S.woods.set_parent(Colour.RED, 3, new)
+        problems = validation.validate_wood(G, S.woods)
+        assert sorted(problems['uncoloured edge']) == sorted([3, old])
+        assert sorted(problems['edge coloured more than once']) == sorted([3, new])
+        with self.assertRaises(Exception):
+            validation.check_wood(G, S.woods)
+    
+    def test_cycle_and_out_degree(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        u = next(node for node in G if node not in S.woods.roots and S.woods.children(Colour.GREEN, node))
+        child = S.woods.children(Colour.GREEN, u)[0]
+        S.woods.set_parent(Colour.GREEN, u, child)
+        S.woods.green_tree.add_edge(child, -3)
+        problems = validation.validate_wood(G, S.woods)
+        assert child in problems['green out-degree']
+        assert u in problems['green tree does not reach'] and child in problems['green tree does not reach']
+    
+    def test_swapped_colours(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        u = 50
+        red, blue = S.woods.parent(Colour.RED, u), S.woods.parent(Colour.BLUE, u)
+        S.woods.set_parent(Colour.RED, u, blue)
+        S.woods.set_parent(Colour.BLUE, u, red)
+        problems = validation.validate_wood(G, S.woods)
+        assert u in problems['local condition']
+        assert 'uncoloured edge' not in problems and 'red out-degree' not in problems
+
+class TestDrawing(unittest.TestCase):
+    
+    def crosses(self, p, q, r, s):
+        def orientation(a, b, c):
+            area = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+            return (area > 0) - (area < 0)
+        return orientation(p, q, r) * orientation(p, q, s) < 0 and orientation(r, s, p) * orientation(r, s, q) < 0
+    
+    def test_planar(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        positions = drawing.grid_positions(R.coords)
+        n = R.n
+        assert positions.min() >= 0 and positions.max() <= 2 * n - 5
+        assert len({tuple(p) for p in positions.tolist()}) == n
+        assert positions[R.index[-1]].tolist() == [0, 0]
+        edges = [(R.index[u], R.index[v]) for (u, v) in G.edges]
+        positions = positions.tolist()
+        for ((a, b), (c, d)) in itertools.combinations(edges, 2):
+            if len({a, b, c, d}) == 4:
+                assert not self.crosses(positions[a], positions[b], positions[c], positions[d])
+    
+    def test_export(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest4.edgelist')
+        R = localroute.compile_router(G, S)
+        positions = drawing.grid_positions(R.coords)
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, 'drawing')
+            drawing.export_drawing(R, prefix, 'npy', chunk=5)
+            vertices = np.load(f'{prefix}.vertices.npy')
+            edges = np.load(f'{prefix}.edges.npy')
+            assert vertices['node'].tolist() == R.nodes
+            assert (vertices['x'] == positions[:, 0]).all() and (vertices['y'] == positions[:, 1]).all()
+            assert len(edges) == G.number_of_edges()
+            for (u, v, c) in edges.tolist():
+                if c >= 0:
+                    assert S.woods.parent(list(Colour)[c], u) == v
+            drawing.export_drawing(R, prefix, 'csv', chunk=5)
+            with open(f'{prefix}.edges.csv') as f:
+                lines = f.read().splitlines()
+            assert lines[0] == 'source,target,colour' and len(lines) == G.number_of_edges() + 1
+            names = ['red', 'blue', 'green']
+            assert lines[1:] == [f'{u},{v},{names[c] if c >= 0 else ""}' for (u, v, c) in edges.tolist()]
+
+class TestLabels(unittest.TestCase):
+    
+    def test_same_paths(self):
+        for i in [1, 2, 3, 4]:
+            G, S = evaluation.parse_edgelist_to_schnyder(f'unittest{i}.edgelist')
+            R = localroute.compile_router(G, S)
+            L = labels.encode(R)
+            assert L.footprint() == R.n * labels.table_dtype.itemsize + 8 * len(R.indices)
+            for (s, t) in itertools.product(G.nodes, G.nodes):
+                path = L.route(L.label_of(s), L.label_of(t))
+                expected = [s] + [v for (u, v) in R.route(s, t)]
+                assert path == [L.label_of(node) for node in expected]
+    
+    def test_packing(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        L = labels.encode(R)
+        for i in range(R.n):
+            label, parents, neighbours = L.state(i)
+            assert list(labels.unpack(label, L.bits)) == R.coords[i].tolist()
+            assert [L.row_of(x) for x in neighbours] == csr.row(R.indptr, R.indices, i).tolist()
+            for c in range(3):
+                if R.parents[c, i] >= 0:
+                    assert L.row_of(parents[c]) == R.parents[c, i]
+                else:
+                    assert parents[c] == labels.NO_PARENT
+
+class TestSimulation(unittest.TestCase):
+    
+    def test_uncongested(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        sim = simulation.Simulation(R, capacity=1e9, propagation=1.0)
+        sim.add_flow(5, 60, 0.5)
+        report = sim.run(200, seed=1)
+        hops = len(R.route(R.nodes[5], R.nodes[60]))
+        assert report['delivered'] > 0
+        assert report['hops']['max'] == report['hops']['mean'] == hops
+        assert abs(report['latency']['max'] - hops) < 1e-6
+        assert report['queueing_delay']['max'] < 1e-6
+        assert report['injected'] == report['delivered'] + report['dropped'] + report['in_flight']
+    
+    def test_congested(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        sim = simulation.Simulation(R, capacity=1.0, buffer=5)
+        simulation.random_flows(sim, 50, 0.2, seed=2)
+        report = sim.run(100, seed=3, top=5)
+        assert report['dropped'] > 0
+        assert report['injected'] == report['delivered'] + report['dropped'] + report['in_flight']
+        assert 0 < report['links']['utilisation_max'] <= 1 + 1e-9
+        assert all(link['max_backlog'] < 5 for link in report['links']['busiest'])
+        loads = [spot['forwarded'] for spot in report['hot_spots']]
+        assert loads == sorted(loads, reverse=True) and len(loads) == 5
+    
+    def test_flow_window(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        sim = simulation.Simulation(R)
+        with self.assertRaises(Exception):
+            sim.add_flow(5, 60, 0.0)
+        sim.add_flow(5, 60, 0.01, stop=0.5)
+        sim.add_flow(7, 60, 0.01, start=300)
+        assert sim.run(200, seed=1)['injected'] == 0
+    
+    def test_undelivered_flow(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest3.edgelist')
+        R = localroute.compile_router(G, S)
+        # A router that bounces between nodes 0 and 1 never reaches 2
+        R.next_batch = lambda src, dest, strict=True: np.where(src == 0, 1, 0)
+        sim = simulation.Simulation(R)
+        sim.add_flow(0, 2, 1.0)
+        with self.assertRaisesRegex(Exception, 'does not deliver'):
+            sim.run(20, seed=1)
+
+class TestAncestry(unittest.TestCase):
+    
+    def test_paths(self):
+        for filename in ['unittest4.edgelist', 'eval-n100-1.edgelist']:
+            G, S = evaluation.parse_edgelist_to_schnyder(filename)
+            R = localroute.compile_router(G, S)
+            A = ancestry.ancestry_index(R)
+            inner = [node for node in R.nodes if node not in S.woods.roots]
+            nodes = np.arange(R.n)
+            for colour in Colour:
+                paths = {v: R.indices_of(S.woods.path_nodes(colour, v)).tolist() for v in inner}
+                for (v, path) in paths.items():
+                    i = R.index[v]
+                    assert A.depth(colour, i) == len(path) - 1
+                    assert A.kth_ancestor(colour, np.full(len(path) + 1, i), np.arange(len(path) + 1)).tolist() == path + [-1]
+                    assert np.flatnonzero(A.is_ancestor(colour, nodes, i)).tolist() == sorted(path)
+                for other in Colour:
+                    for u in inner[::7]:
+                        meet = A.path_intersection(colour, R.index[u], other, R.indices_of(inner))
+                        for (v, x) in zip(inner, meet.tolist()):
+                            common = [w for w in paths[u] if w in R.indices_of(S.woods.path_nodes(other, v))]
+                            assert x == (common[0] if common else -1)
+    
+    def test_regions(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        A = ancestry.ancestry_index(R)
+        u, v = np.meshgrid(np.arange(R.n), np.arange(R.n))
+        for colour in Colour:
+            inside = A.in_region(colour, u, v)
+            for (i, node) in enumerate(R.nodes):
+                assert inside[i].sum() == S.data.region_size_nodes(colour, node)
+                assert inside[i, i]
+            # u in R(v) implies R(u) is inside R(v)
+            counts = inside.astype(np.int64)
+            assert ((counts @ counts > 0) <= inside).all()
+
+class TestMatrices(unittest.TestCase):
+    
+    def test_resume(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        expected = evaluation.evaluate_routing_protocol_faster(G, S)
+        with tempfile.TemporaryDirectory() as directory:
+            prefix = os.path.join(directory, 'n100')
+            partial = evaluation.write_distance_matrices(R, prefix, targets=np.arange(0, R.n, 3))
+            assert partial.routing.dtype == np.uint16
+            assert len(partial.pending()) == R.n - len(range(0, R.n, 3))
+            del partial
+            evaluation.write_distance_matrices(R, prefix)
+            M = matrices.DistanceMatrices(prefix)
+            assert M.complete() and isinstance(M.routing, np.memmap)
+            assert M.nodes.tolist() == list(R.nodes)
+            values = M.distortion(np.arange(M.n))
+            found = {(M.nodes[s], M.nodes[t]): values[t, s] for (t, s) in zip(*np.nonzero(~np.isnan(values)))}
+            assert found.keys() == expected.keys()
+            assert all(abs(found[pair] - expected[pair]) < 1e-12 for pair in expected)
+            with self.assertRaises(Exception):
+                matrices.create(prefix, np.arange(R.n) + 1)
+
+class TestResumableEvaluation(unittest.TestCase):
+    
+    def test_resume(self):
+        files = ['eval-n100-1.edgelist', 'eval-n100-2.edgelist']
+        expected = [evaluation.evaluate_routing_protocol_streaming(*evaluation.parse_edgelist_to_schnyder(filename)) for filename in files]
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache:
+            # Stop after the first graph; its shards are merged into one checkpoint
+            results = evaluation.evaluate_files(files, jobs=1, shard_size=30, checkpoint_dir=directory, cache_dir=cache)
+            filename, n, stats = next(results)
+            results.close()
+            assert filename == files[0] and n == 100
+            assert os.listdir(directory) == [f'{storage.file_hash(files[0])}.json']
+            # A leftover shard of the second graph is reused
+            digest = storage.file_hash(files[1])
+            R = storage.load_edgelist_cached(files[1], cache).router()
+            shard = evaluation.evaluate_destinations(R, np.arange(25)).to_dict()
+            evaluation.write_checkpoint(evaluation.checkpoint_path(directory, digest, 0, 4), {'n': 100, 'stats': shard})
+            results = list(evaluation.evaluate_files(files + [files[0]], jobs=1, shard_size=30, checkpoint_dir=directory, cache_dir=cache))
+            assert [filename for (filename, n, stats) in results] == [files[0], files[0], files[1]]
+            for (filename, n, stats) in results:
+                reference = expected[files.index(filename)]
+                assert (stats.counts == reference.counts).all()
+                assert stats.max() == reference.max()
+            assert sorted(os.listdir(directory)) == sorted(f'{storage.file_hash(filename)}.json' for filename in files)
+    
+    def test_parallel(self):
+        files = ['eval-n100-1.edgelist', 'eval-n100-2.edgelist', 'unittest3.edgelist']
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache:
+            serial = {filename: stats.max() for (filename, n, stats) in evaluation.evaluate_files(files, jobs=1, shard_size=40, checkpoint_dir=directory, cache_dir=cache)}
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache:
+            parallel = {filename: stats.max() for (filename, n, stats) in evaluation.evaluate_files(files, jobs=2, shard_size=40, checkpoint_dir=directory, cache_dir=cache)}
+        assert serial == parallel and sorted(serial) == sorted(files)
+
+class TestWorstCase(unittest.TestCase):
+    
+    def test_matches_full_evaluation(self):
+        for filename in ['unittest3.edgelist', 'unittest4.edgelist', 'eval-n100-1.edgelist', 'eval-n100-2.edgelist']:
+            G, S = evaluation.parse_edgelist_to_schnyder(filename)
+            R = localroute.compile_router(G, S)
+            value, src, dest, stats = worstcase.max_distortion(R)
+            distortion = evaluation.evaluate_routing_protocol_faster(G, S)
+            assert value == max(distortion.values())
+            assert distortion[(src, dest)] == value
+            assert stats['destinations'] == R.n
+    
+    def test_tree_depths(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('eval-n100-1.edgelist')
+        R = localroute.compile_router(G, S)
+        depths = worstcase.tree_depths(R)
+        for colour in Colour:
+            for (i, node) in enumerate(R.nodes):
+                if node in S.woods.roots and node != S.woods.root(colour):
+                    assert depths[col_index(colour), i] == -1
+                else:
+                    assert depths[col_index(colour), i] == S.data.path_length(colour, node)
+
+class TestVerify(unittest.TestCase):
+    
+    def test_walk_ends(self):
+        # 0 -> 1 -> 2 (dest), 3 -> 4 -> 5 -> 3 loops, 6 -> 3, 7 has no next hop and 8 -> 7
+        next_hops = np.array([1, 2, 2, 4, 5, 3, 3, -1, 7])
+        end = verify.walk_ends(next_hops, 2)
+        assert end[[0, 1, 2]].tolist() == [2, 2, 2]
+        assert end[[7, 8]].tolist() == [-1, -1]
+        assert set(end[[3, 4, 5, 6]].tolist()) <= {3, 4, 5}
+        assert verify.find_cycles(next_hops, end[[3, 4, 5, 6]]) in [[[3, 4, 5]], [[4, 5, 3]], [[5, 3, 4]]]
+    
+    def test_verify_router(self):
+        for filename in ['unittest3.edgelist', 'eval-n100-1.edgelist']:
+            G, S = evaluation.parse_edgelist_to_schnyder(filename)
+            R = localroute.compile_router(G, S)
+            report = verify.verify_router(R)
+            assert report['failures'] == []
+            assert report['destinations'] == R.n
+            longest = max(len(localroute.schnyder_local_route(G, S, s, t)) for s in G.nodes for t in G.nodes)
+            assert report['longest_route'] == longest
+            report = verify.verify_router(R, max_hops=longest - 1)
+            assert len(report['failures']) > 0
+            assert all(problems['over_budget'] > 0 and problems['cycles'] == [] for problems in report['failures'])
+    
+    def test_hop_budget(self):
+        G, S = evaluation.parse_edgelist_to_schnyder('unittest3.edgelist')
+        R = localroute.compile_router(G, S)
+        cache = localroute.RouteCache(R)
+        for s in G.nodes:
+            for t in G.nodes:
+                hops = len(localroute.schnyder_local_route(G, S, s, t))
+                assert len(R.route(s, t, max_hops=hops)) == hops
+                if hops > 0:
+                    for route in [lambda: localroute.schnyder_local_route(G, S, s, t, max_hops=hops - 1),
+                                  lambda: R.route(s, t, max_hops=hops - 1), lambda: cache.route(s, t, max_hops=hops - 1)]:
+                        with self.assertRaises(Exception):
+                            route()
+        L = labels.encode(R)
+        assert len(L.route(L.label_of(-1), L.label_of(-2), max_hops=1)) == 2
+        with self.assertRaises(Exception):
+            L.route(L.label_of(-1), L.label_of(3), max_hops=0)
+        # A router that bounces between nodes 0 and 1 never reaches 2
+        R.next_batch = lambda src, dest, strict=True: np.where(src == 0, 1, 0)
+        assert R.route_batch([0, 1], [2, 2]).tolist() == [-1, -1]
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,186 @@
+import argparse
+import numpy as np
+from array import array
+from multiprocessing import Pool
+
+import schnyder
+from colour import Colour
+
+# Random maximal planar graphs without SageMath.
+# Vertices are inserted into uniformly random inner faces of the outer triangle, then random
+# edge flips mix the result away from the stacked triangulations that insertion alone produces.
+# Vertices 0, 1, 2 are the outer triangle; they are labeled -1, -2, -3 like the Sage export,
+# and inner vertices keep their ids 3..n-1.
+
+class HalfEdges:
+    # Half-edge 2e and 2e + 1 are the two sides of edge e, so the twin of h is h ^ 1.
+    # Faces are traversed by nxt; face 0 is the outer face.
+
+    def __init__(self):
+        self.origin = array('i', [0, 1, 1, 2, 2, 0])
+        self.nxt = array('i', [2, 5, 4, 1, 0, 3])
+        self.face = array('i', [1, 0, 1, 0, 1, 0])
+        self.face_edge = array('i', [1, 0])
+        self.vertex_edge = array('i', [0, 2, 4])
+        self.degree = array('i', [2, 2, 2])
+        self.vertices = 3
+
+    def add_edge(self, u, v, face_uv, face_vu):
+        h = len(self.origin)
+        self.origin.extend((u, v))
+        self.nxt.extend((0, 0))
+        self.face.extend((face_uv, face_vu))
+        return h
+
+    def insert_vertex(self, f):
+        v = self.vertices
+        self.vertices += 1
+        a = self.face_edge[f]
+        b = self.nxt[a]
+        c = self.nxt[b]
+        x, y, z = self.origin[a], self.origin[b], self.origin[c]
+        f1 = len(self.face_edge)
+        f2 = f1 + 1
+        self.face_edge.extend((b, c))
+
+        yv = self.add_edge(y, v, f, f1)
+        zv = self.add_edge(z, v, f1, f2)
+        xv = self.add_edge(x, v, f2, f)
+        nxt = self.nxt
+        # Faces (x, y, v), (y, z, v) and (z, x, v)
+        nxt[a], nxt[yv], nxt[xv + 1] = yv, xv + 1, a
+        nxt[b], nxt[zv], nxt[yv + 1] = zv, yv + 1, b
+        nxt[c], nxt[xv], nxt[zv + 1] = xv, zv + 1, c
+        self.face[b] = f1
+        self.face[c] = f2
+        self.vertex_edge.append(xv + 1)
+        self.degree.append(3)
+        self.degree[x] += 1
+        self.degree[y] += 1
+        self.degree[z] += 1
+
+    def adjacent(self, u, w):
+        origin, nxt = self.origin, self.nxt
+        start = self.vertex_edge[u]
+        h = start
+        while True:
+            if origin[h ^ 1] == w:
+                return True
+            h = nxt[h ^ 1]
+            if h == start:
+                return False
+
+    def flip(self, e):
+        # Replaces edge e = u-w, shared by faces (u, w, p) and (w, u, q), with p-q
+        h, t = 2 * e, 2 * e + 1
+        origin, nxt, face = self.origin, self.nxt, self.face
+        if face[h] == 0 or face[t] == 0:
+            return False
+        h1 = nxt[h]
+        h2 = nxt[h1]
+        t1 = nxt[t]
+        t2 = nxt[t1]
+        u, w = origin[h], origin[t]
+        p, q = origin[h2], origin[t2]
+        degree = self.degree
+        if self.adjacent(p, q) if degree[p] <= degree[q] else self.adjacent(q, p):
+            return False
+        origin[h], origin[t] = q, p
+        nxt[h], nxt[h2], nxt[t1] = h2, t1, h
+        nxt[t], nxt[t2], nxt[h1] = t2, h1, t
+        face[t1] = face[h]
+        face[h1] = face[t]
+        self.face_edge[face[h]] = h
+        self.face_edge[face[t]] = t
+        self.vertex_edge[u] = t1
+        self.vertex_edge[w] = h1
+        degree[u] -= 1
+        degree[w] -= 1
+        degree[p] += 1
+        degree[q] += 1
+        return True
+
+    def rotation(self, v):
+        origin, nxt = self.origin, self.nxt
+        start = self.vertex_edge[v]
+        h = start
+        around = []
+        while True:
+            around.append(origin[h ^ 1])
+            h = nxt[h ^ 1]
+            if h == start:
+                return around
+
+def label(v):
+    return -(v + 1) if v < 3 else v
+
+def random_half_edges(n, seed=None, flips=None):
+    if n < 3:
+        raise Exception(f'Triangulation needs at least 3 vertices, got {n}')
+    rng = np.random.default_rng(seed)
+    H = HalfEdges()
+    # After k insertions there are 2k + 1 inner faces, numbered from 1
+    steps = np.arange(n - 3)
+    faces = (rng.random(n - 3) * (2 * steps + 1)).astype(np.int64) + 1
+    for f in faces.tolist():
+        H.insert_vertex(f)
+
+    if flips is None:
+        flips = 3 * n
+    if n > 4:
+        for e in rng.integers(3, 3 * n - 6, size=flips).tolist():
+            H.flip(e)
+    return H
+
+def random_triangulation(n, seed=None, flips=None):
+    # Returns (edges, rotation) with Sage-style labels; edges is an (m, 2) array
+    H = random_half_edges(n, seed, flips)
+    origin = np.frombuffer(H.origin, dtype=np.int32)
+    edges = origin.reshape(-1, 2).astype(np.int64)
+    edges = np.where(edges < 3, -(edges + 1), edges)
+    rotation = {label(v): [label(w) for w in H.rotation(v)] for v in range(n)}
+    return edges, rotation
+
+def random_wood(n, seed=None, flips=None):
+    # Minimal Schnyder wood of a random triangulation as {colour: (m, 2) array of labeled edges}.
+    # -1 = green root, -2 = blue root, -3 = red root, as in the Sage export.
+    H = random_half_edges(n, seed, flips)
+    rot = [H.rotation(v) for v in range(n)]
+    parents = schnyder.wood_parents(rot, 2, 0, 1)
+    edges = dict()
+    for colour in Colour:
+        parent = np.array(parents[colour], dtype=np.int64)
+        nodes = np.flatnonzero(parent >= 0)
+        pairs = np.stack([nodes, parent[nodes]], axis=1)
+        edges[colour] = np.where(pairs < 3, -(pairs + 1), pairs)
+    return edges
+
+def write_wood_edgelist(edges, filename):
+    # Same line format as the Sage export, without the exterior edges
+    with open(filename, 'w') as f:
+        for colour in Colour:
+            name = colour.name.lower()
+            f.writelines(f"{u} {v} {{'weight': '{name}'}}\n" for (u, v) in edges[colour].tolist())
+
+def generate(job):
+    n, filename, seed = job
+    write_wood_edgelist(random_wood(n, seed), filename)
+    return filename
+
+def generate_corpus(n, count, seed=None, processes=None, prefix='eval'):
+    # Writes {prefix}-n{n}-{i}.edgelist for i = 1..count with independent seeds
+    seeds = np.random.SeedSequence(seed).spawn(count)
+    jobs = [(n, f'{prefix}-n{n}-{i}.edgelist', seeds[i - 1]) for i in range(1, count + 1)]
+    with Pool(processes=processes) as pool:
+        return pool.map(generate, jobs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate random Schnyder wood edgelists')
+    parser.add_argument('--n', type=int, default=2500)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--prefix', default='eval')
+    args = parser.parse_args()
+    for filename in generate_corpus(args.n, args.count, args.seed, args.jobs, args.prefix):
+        print(filename)
@@ -0,0 +1,136 @@
+import networkx as nx
+import numpy as np
+
+import csr
+import schnyder
+from colour import Colour, col_index
+
+# Up-front validation of a Schnyder wood, so a malformed wood is rejected before routing.
+# Everything is computed on arrays over the half-edges, in time linear in the graph size
+# apart from finding an embedding when none is given.
+#
+# Checks:
+# * every inner vertex has exactly one outgoing edge of each colour, and roots have none
+# * every edge of G is coloured exactly once, except the edges of the outer triangle
+# * each colour's parent pointers form a tree spanning the inner vertices, rooted at its root
+# * the local vertex condition: around every inner vertex the edges come in the cyclic order
+#   out RED, in GREEN*, out BLUE, in RED*, out GREEN, in BLUE* (or its mirror image)
+
+def coloured_edges(woods):
+    # (sources, targets, colours) as lists of labels and col_index values
+    if isinstance(woods, schnyder.CompactWoods):
+        sources, targets, colours = [], [], []
+        for colour in Colour:
+            parent = woods.parents[col_index(colour)]
+            nodes = np.flatnonzero(parent >= 0).tolist()
+            sources.extend(woods.nodes[i] for i in nodes)
+            targets.extend(woods.nodes[parent[i]] for i in nodes)
+            colours.extend([col_index(colour)] * len(nodes))
+        return sources, targets, colours
+    edges = [(u, v, col_index(colour)) for colour in Colour for (u, v) in woods.tree_map[colour].edges]
+    return [u for (u, v, c) in edges], [v for (u, v, c) in edges], [c for (u, v, c) in edges]
+
+def rotation_arrays(G, embedding, index):
+    # CSR rows of neighbours in rotation order. embedding is a PlanarEmbedding or a dict
+    # mapping each node to its neighbours in clockwise (or counterclockwise) order.
+    if isinstance(embedding, nx.PlanarEmbedding):
+        rotation = {node: list(embedding.neighbors_cw_order(node)) for node in G.nodes}
+    else:
+        rotation = embedding
+    sources = [index[u] for u in G.nodes for _ in rotation[u]]
+    targets = [index[v] for u in G.nodes for v in rotation[u]]
+    return csr.edges_to_csr(len(index), sources, targets)
+
+def report(problems, name, mask, nodes):
+    offenders = np.flatnonzero(mask)
+    if len(offenders) > 0:
+        problems[name] = [nodes[i] for i in offenders.tolist()]
+
+def validate_wood(G, woods, embedding=None):
+    # Returns {problem: [offending nodes]}, empty when the wood is valid
+    nodes = list(G.nodes)
+    index = {node: i for (i, node) in enumerate(nodes)}
+    n = len(nodes)
+    problems = dict()
+    is_root = np.zeros(n, dtype=bool)
+    roots = {colour: index[woods.root(colour)] for colour in Colour}
+    is_root[list(roots.values())] = True
+
+    # One outgoing edge per colour
+    sources, targets, colours = coloured_edges(woods)
+    missing = [(u, v) for (u, v) in zip(sources, targets) if u not in index or v not in index]
+    if len(missing) > 0:
+        problems['coloured edge with unknown endpoint'] = sorted({node for edge in missing for node in edge if node not in index}, key=str)
+        return problems
+    sources = np.array([index[u] for u in sources], dtype=np.int64)
+    targets = np.array([index[v] for v in targets], dtype=np.int64)
+    colours = np.array(colours, dtype=np.int64)
+    between_roots = is_root[sources] & is_root[targets]
+    sources, targets, colours = sources[~between_roots], targets[~between_roots], colours[~between_roots]
+    out_degree = np.bincount(colours * n + sources, minlength=3 * n).reshape(3, n)
+    for colour in Colour:
+        c = col_index(colour)
+        report(problems, f'{colour.name.lower()} out-degree', (out_degree[c] != 1) & ~is_root, nodes)
+    report(problems, 'root with outgoing edge', out_degree.sum(axis=0) * is_root > 0, nodes)
+    parents = np.full((3, n), -1, dtype=np.int64)
+    parents[colours, sources] = targets
+    for colour in Colour:
+        wrong = (targets == roots[colour]) & (colours != col_index(colour))
+        report(problems, f'edge into {colour.name.lower()} root in another colour', np.bincount(sources[wrong], minlength=n) > 0, nodes)
+
+    # Spanning trees, by breadth first search down from each root
+    for colour in Colour:
+        c = col_index(colour)
+        children = np.flatnonzero((parents[c] >= 0) & ~is_root)
+        indptr, indices = csr.edges_to_csr(n, parents[c, children], children)
+        reached = np.zeros(n, dtype=bool)
+        frontier = np.array([roots[colour]])
+        reached[frontier] = True
+        while len(frontier) > 0:
+            _, frontier = csr.gather_rows(indptr, indices, frontier)
+            frontier = frontier[~reached[frontier]]
+            reached[frontier] = True
+        report(problems, f'{colour.name.lower()} tree does not reach', ~reached & ~is_root, nodes)
+
+    # Half-edges in rotation order, labeled by rank in the local condition: out c is 2c and
+    # in c is 2c + 3 (mod 6), so a valid vertex reads 0..5 cyclically without going back
+    if embedding is None:
+        planar, embedding = nx.check_planarity(G)
+        if not planar:
+            problems['not planar'] = []
+            return problems
+    indptr, indices = rotation_arrays(G, embedding, index)
+    if not (np.diff(indptr) == np.array([G.degree(node) for node in nodes])).all():
+        raise Exception('Embedding does not match the graph')
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    out_match = parents[:, rows] == indices
+    in_match = parents[:, indices] == rows
+    labels = out_match.sum(axis=0) + in_match.sum(axis=0)
+    exterior = is_root[rows] & is_root[indices]
+    uncoloured = (labels == 0) & ~exterior
+    report(problems, 'uncoloured edge', np.bincount(rows[uncoloured], minlength=n) > 0, nodes)
+    report(problems, 'edge coloured more than once', np.bincount(rows[labels > 1], minlength=n) > 0, nodes)
+
+    ranks = np.full(len(rows), -1, dtype=np.int64)
+    for c in range(3):
+        ranks[in_match[c]] = (2 * c + 3) % 6
+        ranks[out_match[c]] = 2 * c
+    after = np.arange(len(rows)) + 1
+    ends = indptr[1:][np.diff(indptr) > 0] - 1
+    after[ends] = indptr[:-1][np.diff(indptr) > 0]
+    descents = np.bincount(rows[ranks[after] < ranks], minlength=n)
+    ascents = np.bincount(rows[ranks[after] > ranks], minlength=n)
+    inner = ~is_root
+    # The whole embedding is read in one orientation; take whichever fits more vertices
+    forward = (descents != 1) & inner
+    backward = (ascents != 1) & inner
+    report(problems, 'local condition', forward if forward.sum() <= backward.sum() else backward, nodes)
+    return problems
+
+def check_wood(G, woods, embedding=None):
+    # Raises with a summary of every problem found
+    problems = validate_wood(G, woods, embedding)
+    if len(problems) > 0:
+        lines = [f'{name}: {offenders[:10]}{" ..." if len(offenders) > 10 else ""} ({len(offenders)} nodes)'
+                 for (name, offenders) in problems.items()]
+        raise Exception('Invalid Schnyder wood\n' + '\n'.join(lines))
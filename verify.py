@@ -0,0 +1,108 @@
+import argparse
+import sys
+import numpy as np
+
+import localroute
+import storage
+
+# Whole-graph check that local routing delivers every packet, without routing pair by pair.
+#
+# For a fixed destination t the next hop depends only on the current node, so the next-hop
+# vector is a functional graph: following it from any node either reaches t, stops at a node
+# with no valid next hop, or falls into a cycle it never leaves. Nodes without a next hop are
+# pointed at an extra sink node n, and t and the sink point to themselves. A walk of n + 1 hops
+# in a graph of n + 1 nodes ends on a cycle, so after k rounds of pointer jumping with
+# 2^k > n + 1 every node sits on the cycle its walk ends in: t for delivered nodes, the sink
+# for dead ends, and a node of a routing loop otherwise. Each loop is then read off by walking
+# it once from one of its nodes.
+
+def walk_ends(next_hops, dest):
+    # end[v] is dest, -1 for a dead end, or a node on the loop that v falls into
+    n = len(next_hops)
+    jump = np.append(np.asarray(next_hops, dtype=np.int64), n)
+    jump[jump < 0] = n
+    jump[dest] = dest
+    for _ in range((n + 1).bit_length()):
+        jump = jump[jump]
+    end = jump[:n]
+    end[end == n] = -1
+    return end
+
+def find_cycles(next_hops, ends):
+    # The distinct loops through the given nodes, each as a list of indices in routing order
+    next_hops = np.asarray(next_hops).tolist()
+    seen = set()
+    cycles = []
+    for start in np.unique(ends).tolist():
+        if start in seen:
+            continue
+        cycle = [start]
+        node = next_hops[start]
+        while node != start:
+            cycle.append(node)
+            node = next_hops[node]
+        seen.update(cycle)
+        cycles.append(cycle)
+    return cycles
+
+def check_destination(R, dest, max_hops=None):
+    # (longest route to dest, problems): problems is None when every node reaches dest within
+    # max_hops, and otherwise counts the dead ends, looping nodes and routes over budget and
+    # lists the loops by node label
+    next_hops = R.next_hops(dest, strict=False)
+    end = walk_ends(next_hops, dest)
+    distance = localroute.routing_distances(next_hops, dest)
+    longest = int(distance.max())
+    dead_ends = np.flatnonzero(end == -1)
+    looping = np.flatnonzero((end >= 0) & (end != dest))
+    over_budget = np.flatnonzero(distance > max_hops) if max_hops is not None else np.array([], dtype=np.int64)
+    if len(dead_ends) == 0 and len(looping) == 0 and len(over_budget) == 0:
+        return longest, None
+    failing = np.concatenate([dead_ends, looping, over_budget])
+    return longest, {
+        'dest': R.nodes[dest],
+        'dead_ends': len(dead_ends),
+        'looping': len(looping),
+        'over_budget': len(over_budget),
+        'cycles': [[R.nodes[v] for v in cycle] for cycle in find_cycles(next_hops, end[looping])],
+        'example_src': R.nodes[int(failing.min())]
+    }
+
+def verify_router(R, targets=None, max_hops=None):
+    # Checks routing to every destination index in targets (all by default)
+    if targets is None:
+        targets = np.arange(R.n)
+    longest = 0
+    failures = []
+    for t in np.asarray(targets).tolist():
+        hops, problems = check_destination(R, t, max_hops)
+        longest = max(longest, hops)
+        if problems is not None:
+            failures.append(problems)
+    return {
+        'n': R.n,
+        'destinations': len(targets),
+        'longest_route': longest,
+        'failures': failures
+    }
+
+def verify_file(filename, max_hops=None):
+    return verify_router(storage.load_edgelist_cached(filename).router(), max_hops=max_hops)
+
+if __name__ == '__main__':
+    # python -m verify --files eval-n100-*.edgelist --max-hops 200
+    parser = argparse.ArgumentParser(description='Check that Schnyder local routing delivers between every pair of nodes')
+    parser.add_argument('--files', nargs='+', required=True)
+    parser.add_argument('--max-hops', type=int, default=None, help='also fail routes longer than this')
+    parser.add_argument('--show', type=int, default=5, help='failing destinations to print per file')
+    args = parser.parse_args()
+
+    failed = False
+    for filename in args.files:
+        report = verify_file(filename, args.max_hops)
+        failures = report['failures']
+        print(f'{filename}: n={report["n"]} longest route {report["longest_route"]}, {len(failures)} failing destinations', flush=True)
+        for problems in failures[:args.show]:
+            print(f'  {problems}')
+        failed = failed or len(failures) > 0
+    sys.exit(1 if failed else 0)
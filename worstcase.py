@@ -0,0 +1,70 @@
+import numpy as np
+
+import csr
+import localroute
+
+# Exact maximum distortion, pruning the true distance searches.
+#
+# Every destination is still routed: there is no bound on routing distances tight enough to
+# skip one, so computing the next-hop vector of each destination is the floor and dominates
+# the time. Only the breadth first searches for true distances are cut short or skipped.
+#
+# Destinations are searched one at a time, most promising first, keeping the best ratio found so
+# far. For a destination t the routing distances r(s, t) of all sources come from one next-hop
+# vector. True distances are bounded below by landmarks: d(s, t) >= |d(l, s) - d(l, t)| for
+# every landmark l, and d >= 1. A source whose r / bound cannot beat the best is dropped, and
+# if none is left t needs no search at all. Otherwise no pair farther apart than
+# max r / best can beat it either, so the breadth first search from t stops at that depth,
+# which is usually two or three levels once a good ratio is known.
+#
+# Destinations are ranked by the depth of their deepest tree path, which puts the ones with
+# the longest routes first, and then by their landmark eccentricity, lowest first.
+
+def tree_depths(R):
+    # (3, n) hops to the root along each tree; -1 for the other roots
+    depths = np.empty((3, R.n), dtype=np.int64)
+    for c in range(3):
+        parent = np.array(R.parents[c], dtype=np.int64)
+        root = int(np.flatnonzero((parent < 0) & (np.bincount(parent[parent >= 0], minlength=R.n) > 0))[0])
+        depths[c] = localroute.routing_distances(parent, root)
+    return depths
+
+def landmark_distances(R, count=8):
+    # (k, n) distances from the three roots plus landmarks chosen by farthest point sampling
+    roots = np.flatnonzero((np.asarray(R.parents) < 0).all(axis=0))
+    distances = csr.bfs_distances(R.indptr, R.indices, roots)
+    nearest = distances.min(axis=0)
+    while len(distances) < count:
+        row = csr.bfs_distances(R.indptr, R.indices, [int(np.argmax(nearest))])
+        distances = np.vstack([distances, row])
+        nearest = np.minimum(nearest, row[0])
+    return distances.astype(np.int64)
+
+def max_distortion(R, landmarks=8):
+    # (distortion, src, dest, stats) for a pair of maximum routing distance / true distance;
+    # src and dest are node labels, stats counts the destinations searched and pruned
+    landmark = landmark_distances(R, landmarks)
+    eccentricity = landmark.max(axis=0)
+    order = np.lexsort((eccentricity, -tree_depths(R).max(axis=0)))
+    best, witness = 0.0, None
+    stats = {'destinations': R.n, 'pruned': 0, 'searched_nodes': 0}
+    for t in order.tolist():
+        routing = localroute.routing_distances(R.next_hops(t), t)
+        if (routing < 0).any():
+            raise Exception(f'Routing to {R.nodes[t]} does not deliver from {R.nodes[int(np.argmin(routing))]}')
+        bound = np.maximum(np.abs(landmark - landmark[:, t:t + 1]).max(axis=0), 1)
+        candidates = np.flatnonzero(routing > best * bound)
+        if len(candidates) == 0:
+            stats['pruned'] += 1
+            continue
+        depth = int(routing[candidates].max() / best) if best > 0 else None
+        true = csr.bfs_distances(R.indptr, R.indices, [t], max_depth=depth)[0]
+        stats['searched_nodes'] += int((true >= 0).sum())
+        candidates = candidates[true[candidates] > 0]
+        if len(candidates) == 0:
+            continue
+        ratios = routing[candidates] / true[candidates]
+        i = int(np.argmax(ratios))
+        if ratios[i] > best:
+            best, witness = float(ratios[i]), (int(candidates[i]), t)
+    return best, R.nodes[witness[0]], R.nodes[witness[1]], stats